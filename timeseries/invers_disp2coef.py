@@ -66,7 +66,7 @@ Usage: invers_disp2coef.py  [--cube=<path>] [--lectfile=<path>] [--list_images=<
 --cond=<value>            Condition value for optimization: Singular value smaller than cond are considered zero [default: 1e-3]
 --ineq=<yes/no>           If yes, sequential least-square optimisation. If no, SVD inversion with mask on eigenvalues smaller than --cond value. If postseimsic functions, add ineguality constraints in the inversion. Use least square results without post-seismic functions as a first guess to iterate the inversion. Then, force postseismic to be the same sign and inferior than coseismic steps of the first guess [default: yes].
 --fulloutput=<yes/no>      If yes produce maps of models, residuals, ramps, as well as flatten cube without seasonal and linear term [default: no]
---geotiff=<path>           Path to Geotiff to save outputs in tif format. If None save output are saved as .r4 files 
+--geotiff=<path>           Path to Geotiff to save outputs in tif format. If None save output are saved as .r4 files. With --fulloutput, maps of each date are saved in a single tif with bands flat, ramp_tropo, model, res 
 --plot=<yes/no>         Display plots [default: no]
 --dateslim=<value,value>     Datemin,Datemax time series 
 --crop=<value,value,value,value>            Define a region of interest for the temporal decomposition 
@@ -88,7 +88,6 @@ print('# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #')
 print()
 
 import numpy as np
-from numpy.lib.stride_tricks import as_strided
 import scipy as sp
 import scipy.optimize as opt
 import scipy.linalg as lst
@@ -102,18 +101,33 @@ if environ["TERM"].startswith("screen"):
 #matplotlib.use('TkAgg') # Must be before importing matplotlib.pyplot or pylab!
 # from pylab import *
 import matplotlib.cm as cm
+import matplotlib.colors as mcolors
 import matplotlib.dates as mdates
 from datetime import datetime as datetimes
-from pylab import date2num
 
 try:
     from nsbas import docopt
 except:
     import docopt
 
+try:
+    from numba import njit
+except ImportError:
+    # numba not installed: basis functions run as plain numpy
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
 from contextlib import contextmanager
 from functools import wraps, partial
-# import multiprocessing
+import multiprocessing
+import mmap
 import logging
 
 import warnings
@@ -139,10 +153,22 @@ class pattern:
 
 ### BASIS FUNCTIONS: function of time
 
+# compiled kernels (single pass over t, no temporaries when numba is available)
+# explicit signatures: compiled at import and cached on disk between runs
+@njit('float64[:](float64[:])', cache=True, fastmath=True)
+def _heaviside(t):
+    return np.where(t>=0, 1.0, 0.0)
+
+@njit('float64[:](float64[:], float64, float64)', cache=True, fastmath=True)
+def _postseismic(t, to, tcar):
+    return np.log10(1 + np.maximum((t-to)/tcar, 0.))
+
+@njit('float64[:](float64[:], float64, float64)', cache=True, fastmath=True)
+def _slowslip(t, to, tcar):
+    return 0.5*(np.tanh((t-to)/tcar)-1) + 1
+
 def Heaviside(t):
-        h=np.zeros((len(t)))
-        h[t>=0]=1.0
-        return h
+        return _heaviside(np.asarray(t, dtype=np.float64))
 
 def Box(t):
         return Heaviside(t+0.5)-Heaviside(t-0.5)
@@ -162,10 +188,7 @@ class postseismic(pattern):
           self.tcar=tcar
 
       def g(self,t):
-        t=(t-self.to)/self.tcar
-        t[t<=0] = 0
-        g = np.log10(1+t)
-        return g
+        return _postseismic(np.asarray(t, dtype=np.float64), self.to, self.tcar)
 
 class reference(pattern):
     def __init__(self,name,reduction,date):
@@ -188,10 +211,7 @@ class sin2var(pattern):
          self.to=date
 
      def g(self,t):
-         func=np.zeros(t.size)
-         for i in range(t.size):
-             func[i]=math.sin(4*math.pi*(t[i]-self.to))
-         return func
+         return np.sin(4*np.pi*(t-self.to))
 
 class cos2var(pattern):
      def __init__(self,name,reduction,date):
@@ -199,10 +219,7 @@ class cos2var(pattern):
          self.to=date
 
      def g(self,t):
-         func=np.zeros(t.size)
-         for i in range(t.size):
-             func[i]=math.cos(4*math.pi*(t[i]-self.to))
-         return func
+         return np.cos(4*np.pi*(t-self.to))
 
 class sin5var(pattern):
      def __init__(self,name,reduction,date):
@@ -210,10 +227,7 @@ class sin5var(pattern):
          self.to=date
 
      def g(self,t):
-         func=np.zeros(t.size)
-         for i in range(t.size):
-             func[i]=math.sin(math.pi*(t[i]-self.to))
-         return func
+         return np.sin(np.pi*(t-self.to))
 
 class cos5var(pattern):
      def __init__(self,name,reduction,date):
@@ -221,10 +235,7 @@ class cos5var(pattern):
          self.to=date
 
      def g(self,t):
-         func=np.zeros(t.size)
-         for i in range(t.size):
-             func[i]=math.cos(math.pi*(t[i]-self.to))
-         return func
+         return np.cos(np.pi*(t-self.to))
 
 class sinvar(pattern):
     def __init__(self,name,reduction,date):
@@ -232,10 +243,7 @@ class sinvar(pattern):
         self.to=date
 
     def g(self,t):
-        func=np.zeros(t.size)
-        for i in range(t.size):
-            func[i]=math.sin(2*math.pi*(t[i]-self.to))
-        return func
+        return np.sin(2*np.pi*(t-self.to))
 
 class cosvar(pattern):
     def __init__(self,name,reduction,date):
@@ -243,10 +251,7 @@ class cosvar(pattern):
         self.to=date
 
     def g(self,t):
-        func=np.zeros(t.size)
-        for i in range(t.size):
-            func[i]=math.cos(2*math.pi*(t[i]-self.to))
-        return func
+        return np.cos(2*np.pi*(t-self.to))
 
 class slowslip(pattern):
       def __init__(self,name,reduction,date,tcar=1):
@@ -255,9 +260,7 @@ class slowslip(pattern):
           self.tcar=tcar
 
       def g(self,t):
-          t=(t-self.to)/self.tcar
-          funct = 0.5*(np.tanh(t)-1) + 1
-          return funct
+          return _slowslip(np.asarray(t, dtype=np.float64), self.to, self.tcar)
 
 ### KERNEL FUNCTIONS: not function of time
 class corrdem(pattern):
@@ -286,15 +289,17 @@ class vector(pattern):
     def g(self,index):
         return self.func[index]
 
+def date2datetime(dates):
+    # YYYYMMDD to numpy datetime64[D]
+    dates = np.atleast_1d(dates).astype(int)
+    months = (dates//10000-1970).astype('datetime64[Y]') + (dates//100%100-1).astype('timedelta64[M]')
+    return months.astype('datetime64[D]') + (dates%100-1).astype('timedelta64[D]')
+
 def date2dec(dates):
-    dates  = np.atleast_1d(dates)
-    times = []
-    for date in dates:
-        x = datetimes.strptime('{}'.format(date),'%Y%m%d')
-        dec = float(x.strftime('%j'))/365.1
-        year = float(x.strftime('%Y'))
-        times.append(year + dec)
-    return times
+    days = date2datetime(dates)
+    year = days.astype('datetime64[Y]')
+    doy = (days - year.astype('datetime64[D]')).astype(int) + 1
+    return (year.astype(int) + 1970) + doy/365.1
 
 
 ##################################################################################
@@ -329,6 +334,48 @@ def checkinfile(file):
         logger.critical("File: {0} not found, Exit !".format(file))
         logger.info("File: {0} not found in {1}, Exit !".format(file,getcwd()))
 
+def read_map(infile):
+    '''Read the cropped area of a map: .tif with gdal, otherwise raw float32 of size nlines x ncol'''
+    checkinfile(infile)
+    extension = os.path.splitext(infile)[1]
+    if extension == ".tif":
+      ds = gdal.Open(infile, gdal.GA_ReadOnly)
+      band = ds.GetRasterBand(1)
+      data = band.ReadAsArray(jbeg, ibeg, jend-jbeg, iend-ibeg)
+      del ds
+    else:
+      data = np.array(np.memmap(infile,dtype=np.float32,mode='r',shape=(nlines,ncol))[ibeg:iend,jbeg:jend])
+    return data
+
+def init_worker():
+    # parallelism is over pixels: one BLAS thread per process
+    if threadpool_limits is not None:
+        threadpool_limits(1)
+
+class axes_record(object):
+    # record the plot calls made on an axes, to draw them later on a real one
+    # (pool workers cannot draw in the figures of the main process)
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self,name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.calls.append((name,args,kwargs))
+
+    def replay(self,ax):
+        for name,args,kwargs in self.calls:
+            getattr(ax,name)(*args,**kwargs)
+
+def shared_zeros(shape,dtype=np.float32,filename=None):
+    '''Zero array in shared memory: written by the forked pool workers in place,
+    without sending the results back to the main process. Anonymous memory,
+    or mapped on filename (pages then go to the file instead of the RAM)'''
+    if filename is not None:
+        return np.memmap(filename,dtype=dtype,mode='w+',shape=shape)
+    nbytes = int(np.prod(shape))*np.dtype(dtype).itemsize
+    return np.frombuffer(mmap.mmap(-1,max(nbytes,1)),dtype=dtype,count=int(np.prod(shape))).reshape(shape)
+
 # create generator for pool
 @contextmanager
 def poolcontext(*arg, **kargs):
@@ -403,6 +450,8 @@ if arguments["--geotiff"] is not None:
     gt = georef.GetGeoTransform()
     proj = georef.GetProjection()
     driver = gdal.GetDriverByName('GTiff')
+    # tiled and compressed outputs, predictor for floating point data
+    tiff_options = ['TILED=YES','BLOCKXSIZE=256','BLOCKYSIZE=256','COMPRESS=LZW','PREDICTOR=3','BIGTIFF=IF_SAFER']
     logger.warning('Set geotiff projection: {}'.format(proj))
 if arguments["--ivar"] == None:
     ivar = 0
@@ -471,7 +520,7 @@ if arguments["--dateslim"] is not  None:
     datemin = date2dec(dmin)
     datemax = date2dec(dmax)
 else:
-    datemin, datemax = np.int(np.min(dates)), np.int(np.max(dates))+1
+    datemin, datemax = int(np.min(dates)), int(np.max(dates))+1
     dmax = str(datemax) + '0101'
     dmin = str(datemin) + '0101'
 
@@ -513,24 +562,23 @@ ibeg,iend,jbeg,jend = int(crop[0]),int(crop[1]),int(crop[2]),int(crop[3])
 
 # extract time series
 # cube = np.zeros((nlines,ncol,N)).flatten()
-cubei = np.fromfile(arguments["--cube"],dtype=np.float32)
-cube = as_strided(cubei[:nlines*ncol*N])
-logger.info('Load time series cube: {0}, with length: {1}'.format(arguments["--cube"], len(cube)))
-kk = np.flatnonzero(cube>9990)
-cube[kk] = float('NaN')
-maps_temp = cube.reshape((nlines,ncol,N))
+cubei = np.memmap(arguments["--cube"],dtype=np.float32,mode='r',shape=(nlines*ncol*N,))
+logger.info('Load time series cube: {0}, with length: {1}'.format(arguments["--cube"], len(cubei)))
+# only read the cropped region from disk
+maps_temp = np.array(cubei.reshape((nlines,ncol,N))[ibeg:iend,jbeg:jend,:])
+del cubei
+maps_temp[maps_temp>9990] = np.nan
 
 # set at NaN zero values for all dates
-# kk = np.nonzero(maps_temp[:,:,-1]==0)
 cst = np.copy(maps_temp[:,:,imref])
-for l in range((N)):
-    maps_temp[:,:,l] = maps_temp[:,:,l] - cst
-    if l != imref:
-        index = np.nonzero(maps_temp[:,:,l]==0.0)
-        maps_temp[:,:,l][index] = np.float('NaN')
+maps_temp -= cst[:,:,np.newaxis]
+zero_mask = maps_temp==0.0
+zero_mask[:,:,imref] = False
+maps_temp[zero_mask] = np.nan
+del zero_mask
 
 N=len(dates)
-maps = np.copy(maps_temp[ibeg:iend,jbeg:jend,indexd])
+maps = maps_temp[:,:,indexd]
 logger.info('Number images between {0} and {1}: {2}'.format(dmin,dmax,N))
 logger.info('Reshape cube: {}'.format(maps.shape))
 new_lines, new_cols = maps.shape[0], maps.shape[1]
@@ -547,7 +595,7 @@ ibeg_emp,iend_emp,jbeg_emp,jend_emp = int(crop_emp[0]),int(crop_emp[1]),int(crop
 # sys.exit(0)
 
 # clean
-del cube, cubei, maps_temp
+del maps_temp
 
 # fig = plt.figure(0)
 # plt.imshow(maps[ibeg_emp:iend_emp,jbeg_emp:jend_emp,-1],vmax=1,vmin=-1)
@@ -559,45 +607,16 @@ del cube, cubei, maps_temp
 nfigure=0
 # open mask file
 if arguments["--mask"] is not None:
-    extension = os.path.splitext(arguments["--mask"])[1]
-    checkinfile(arguments["--mask"])
-    if extension == ".tif":
-      ds = gdal.Open(arguments["--mask"], gdal.GA_ReadOnly)
-      band = ds.GetRasterBand(1)
-      maski = band.ReadAsArray().flatten()*np.float(arguments["--scale_mask"])
-      del ds
-    else:
-      fid = open(arguments["--mask"],'r')
-      maski = np.fromfile(fid,dtype=np.float32)*np.float(arguments["--scale_mask"])
-      fid.close()
-    mask = maski.reshape((nlines,ncol))[ibeg:iend,jbeg:jend]
+    mask = read_map(arguments["--mask"])*float(arguments["--scale_mask"])
     maski = mask.flatten()
 else:
-    mask_flat = np.ones((new_lines,new_cols))
-    mask = np.ones((new_lines,new_cols))
-    maski = mask.flatten()
+    # no mask: skip the mask selection in the empirical estimations
+    mask_flat = None
 
 # open elevation map
 if arguments["--topofile"] is not None:
-    extension = os.path.splitext(arguments["--topofile"])[1]
-    checkinfile(arguments["--topofile"])
-    if extension == ".tif":
-      ds = gdal.Open(arguments["--topofile"], gdal.GA_ReadOnly)
-      band = ds.GetRasterBand(1)
-      elevi = band.ReadAsArray().flatten()
-      del ds
-    else:
-      fid = open(arguments["--topofile"],'r')
-      elevi = np.fromfile(fid,dtype=np.float32)
-      fid.close()
-
-    elevi = elevi[:nlines*ncol]
-    # fig = plt.figure(10)
-    # plt.imshow(elevi.reshape(new_lines,new_cols)[ibeg:iend,jbeg:jend])
-    elev = elevi.reshape((nlines,ncol))[ibeg:iend,jbeg:jend]
-    elev[np.isnan(maps[:,:,-1])] = float('NaN')
-    kk = np.nonzero(abs(elev)>9999.)
-    elev[kk] = float('NaN')
+    elev = read_map(arguments["--topofile"])
+    elev[np.isnan(maps[:,:,-1]) | (abs(elev)>9999.)] = np.nan
     elevi = elev.flatten()
     # fig = plt.figure(11)
     # plt.imshow(elev[ibeg:iend,jbeg:jend])
@@ -614,22 +633,8 @@ else:
    maxtopo,mintopo = 2, 0 
 
 if arguments["--aspect"] is not None:
-    extension = os.path.splitext(arguments["--aspect"])[1]
-    checkinfile(arguments["--aspect"])
-    if extension == ".tif":
-      ds = gdal.Open(arguments["--aspect"], gdal.GA_ReadOnly)
-      band = ds.GetRasterBand(1)
-      aspecti = band.ReadAsArray().flatten()
-      del ds
-    else:
-      fid = open(arguments["--aspect"],'r')
-      aspecti = np.fromfile(fid,dtype=np.float32)
-      fid.close()
-    aspecti = aspecti[:nlines*ncol]
-    slope = aspecti.reshape((nlines,ncol))[ibeg:iend,jbeg:jend]
-    slope[np.isnan(maps[:,:,-1])] = float('NaN')
-    kk = np.nonzero(abs(slope>9999.))
-    slope[kk] = float('NaN')
+    slope = read_map(arguments["--aspect"])
+    slope[np.isnan(maps[:,:,-1]) | (slope>9999.)] = np.nan
     aspecti = slope.flatten()
     # print slope[slope<0]
     # fig = plt.figure(11)
@@ -641,20 +646,19 @@ else:
     aspecti = slope.flatten()
 
 if arguments["--rmspixel"] is not None:
-    checkinfile(arguments["--rmspixel"])
-    rmsmap = np.fromfile(arguments["--rmspixel"],dtype=np.float32).reshape((nlines,ncol))[ibeg:iend,jbeg:jend]
-    kk = np.nonzero(np.logical_or(rmsmap==0.0, rmsmap>999.))
-    rmsmap[kk] = float('NaN')
+    rmsmap = read_map(arguments["--rmspixel"])
+    rmsmap[(rmsmap==0.0) | (rmsmap>999.)] = np.nan
     kk = np.nonzero(rmsmap>float(arguments["--threshold_rms"]))
     spacial_mask = np.copy(rmsmap)
-    spacial_mask[kk] = float('NaN')
-    fig = plt.figure(nfigure,figsize=(9,4))
-    nfigure = nfigure + 1
-    ax = fig.add_subplot(1,1,1)
-    cax = ax.imshow(spacial_mask,cmap=cmap)
-    ax.set_title('Mask on spatial estimation based on RMSpixel')
-    plt.setp( ax.get_xticklabels(), visible=False)
-    fig.colorbar(cax, orientation='vertical',aspect=10)
+    spacial_mask[kk] = np.nan
+    if plot=='yes':
+        fig = plt.figure(nfigure,figsize=(9,4))
+        nfigure = nfigure + 1
+        ax = fig.add_subplot(1,1,1)
+        cax = ax.imshow(spacial_mask,cmap=cmap)
+        ax.set_title('Mask on spatial estimation based on RMSpixel')
+        plt.setp( ax.get_xticklabels(), visible=False)
+        fig.colorbar(cax, orientation='vertical',aspect=10)
     del spacial_mask
     # if plot=='yes':
     #    plt.show()
@@ -664,59 +668,51 @@ else:
     arguments["--threshold_rms"] = 2.
 
 # plot bperp vs time
-fig = plt.figure(nfigure,figsize=(10,4))
-nfigure = nfigure + 1
-ax = fig.add_subplot(1,2,1)
-# convert idates to num
-x = [date2num(datetimes.strptime('{}'.format(d),'%Y%m%d')) for d in idates]
-# format the ticks
-ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y/%m/%d"))
-ax.plot(x,base,"ro",label='Baseline history of the {} images'.format(N))
-ax.plot(x,base,"green")
-# rotates and right aligns the x labels, and moves the bottom of the
-# axes up to make room for them
-fig.autofmt_xdate()
-ax.set_xlabel('Time (Year/month/day)')
-ax.set_ylabel('Perpendicular Baseline')
-plt.legend(loc='best')
-
-ax = fig.add_subplot(1,2,2)
-ax.plot(np.mod(dates,1),base,"ro",label='Baseline seasonality of the {} images'.format(N))
-plt.legend(loc='best')
-
-fig.savefig('baseline.eps', format='EPS',dpi=150)
+if plot=='yes':
+    fig = plt.figure(nfigure,figsize=(10,4))
+    nfigure = nfigure + 1
+    ax = fig.add_subplot(1,2,1)
+    # convert idates to num
+    x = mdates.date2num(date2datetime(idates))
+    # format the ticks
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y/%m/%d"))
+    ax.plot(x,base,"ro",label='Baseline history of the {} images'.format(N))
+    ax.plot(x,base,"green")
+    # rotates and right aligns the x labels, and moves the bottom of the
+    # axes up to make room for them
+    fig.autofmt_xdate()
+    ax.set_xlabel('Time (Year/month/day)')
+    ax.set_ylabel('Perpendicular Baseline')
+    plt.legend(loc='best')
+
+    ax = fig.add_subplot(1,2,2)
+    ax.plot(np.mod(dates,1),base,"ro",label='Baseline seasonality of the {} images'.format(N))
+    plt.legend(loc='best')
+
+    fig.savefig('baseline.eps', format='EPS',dpi=150)
 np.savetxt('bp_t.in', np.vstack([dates,base]).T, fmt='%.6f')
 
 if arguments["--mask"] is not None:
-    los_temp = as_strided(mask[ibeg_emp:iend_emp,jbeg_emp:jend_emp]).flatten()
+    los_temp = mask[ibeg_emp:iend_emp,jbeg_emp:jend_emp].ravel()
 
     if arguments["--rampmask"]=='yes':
         logger.info('Flatten mask...')
-        temp = [(i,j) for i in range(iend_emp-ibeg_emp) for j in range(jend_emp-jbeg_emp) \
-        if np.logical_and((math.isnan(los_temp[i*(jend_emp-jbeg_emp)+j]) is False), \
-            (los_temp[i*(jend_emp-jbeg_emp)+j]>np.float(arguments["--threshold_mask"])))]
-
-        temp2 = np.array(temp)
-        x = temp2[:,0]; y = temp2[:,1]
-        los_clean = los_temp[x*(new_cols)+y]
-        G=np.zeros((len(los_clean),4))
-        G[:,0], G[:,1], G[:,2], G[:,3] = y**2, y, x, 1
+        los2 = los_temp.reshape(iend_emp-ibeg_emp,jend_emp-jbeg_emp)
+        x, y = np.nonzero(np.logical_and(~np.isnan(los2), los2>float(arguments["--threshold_mask"])))
+        los_clean = los2[x,y]
+        G = np.column_stack([y**2, y, x, np.ones(len(los_clean))])
         # ramp inversion
-        pars = np.dot(np.dot(np.linalg.inv(np.dot(G.T,G)),G.T),los_clean)
+        pars = lst.lstsq(G,los_clean,lapack_driver='gelsy')[0]
         a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]
         logger.info('Remove ramp mask %f x**2 %f x  + %f y + %f for : %s'%(a,b,c,d,arguments["--mask"]))
 
         # remove 0 values
         kk = np.flatnonzero(np.logical_or(maski==0, maski==9999))
         #kk = np.flatnonzero(los==9999)
-        maski[kk] = float('NaN')
-
-        G=np.zeros((len(maski),4))
-        for i in range(nlines):
-            G[i*ncol:(i+1)*ncol,0] = (np.arange((ncol)) - jbeg_emp)**2
-            G[i*ncol:(i+1)*ncol,1] = np.arange((ncol)) - jbeg_emp
-            G[i*ncol:(i+1)*ncol,2] = i - ibeg_emp
-        G[:,3] = 1
+        maski[kk] = np.nan
+
+        jj, ii = np.meshgrid(np.arange(new_cols) - jbeg_emp, np.arange(new_lines) - ibeg_emp)
+        G = np.column_stack([jj.ravel()**2, jj.ravel(), ii.ravel(), np.ones(new_lines*new_cols)])
         mask_flat = (maski - np.dot(G,pars)).reshape(new_lines,new_cols)
         mask_flat = mask_flat - np.nanmean(mask_flat)
 
@@ -725,76 +721,85 @@ if arguments["--mask"] is not None:
         # remove 0 values
         kk = np.flatnonzero(np.logical_or(np.logical_or(maski==0, maski==9999),np.isnan(los_temp)))
         #kk = np.flatnonzero(los==9999)
-        maski[kk] = float('NaN')
+        maski[kk] = np.nan
         mask_flat = maski.reshape(new_lines,new_cols)
 
     del maski
 
     # check seuil
-    kk = np.flatnonzero(mask_flat<np.float(arguments["--threshold_mask"]))
+    kk = np.flatnonzero(mask_flat<float(arguments["--threshold_mask"]))
     mask_flat_clean=np.copy(mask_flat.flatten())
-    mask_flat_clean[kk]=float('NaN')
+    mask_flat_clean[kk]=np.nan
     mask_flat_clean = mask_flat_clean.reshape(new_lines,new_cols)
 
     # mask maps if necessary for temporal inversion
     if arguments["--tempmask"]=='yes':
-        kk = np.nonzero(np.logical_or(mask_flat<np.float(arguments["--threshold_mask"]),
-          np.isnan(mask_flat)))
-        for l in range((N)):
-            # clean only selected area
-            d = as_strided(maps[ibeg_emp:iend_emp,jbeg_emp:jend_emp,l])
-            d[kk] = np.float('NaN')
+        kk = np.logical_or(mask_flat<float(arguments["--threshold_mask"]),
+          np.isnan(mask_flat))[ibeg_emp:iend_emp,jbeg_emp:jend_emp]
+        # clean only selected area, all dates at once
+        maps[ibeg_emp:iend_emp,jbeg_emp:jend_emp][kk] = np.nan
 
     # plots
-    nfigure+=1
-    fig = plt.figure(nfigure,figsize=(7,6))
-    vmax = np.abs([np.nanmedian(mask_flat) + np.nanstd(mask_flat),\
-        np.nanmedian(mask_flat) - np.nanstd(mask_flat)]).max()
-    vmin = -vmax
-
-    ax = fig.add_subplot(1,3,1)
-    cax = ax.imshow(mask,cmap=cmap,vmax=vmax,vmin=vmin)
-    ax.set_title('Original Mask')
-    plt.setp( ax.get_xticklabels(), visible=False)
-
-    ax = fig.add_subplot(1,3,2)
-    cax = ax.imshow(mask_flat,cmap=cmap,vmax=vmax,vmin=vmin)
-    ax.set_title('Flat Mask')
-    plt.setp( ax.get_xticklabels(), visible=False)
-    #cbar = fig.colorbar(cax, orientation='vertical',aspect=10)
-
-    ax = fig.add_subplot(1,3,3)
-    cax = ax.imshow(mask_flat_clean,cmap=cmap,vmax=vmax,vmin=vmin)
-    ax.set_title('Final Mask')
-    plt.setp( ax.get_xticklabels(), visible=False)
-    #cbar = fig.colorbar(cax, orientation='vertical',aspect=10)
-    fig.savefig('mask.eps', format='EPS',dpi=150)
+    if plot=='yes':
+        nfigure+=1
+        fig = plt.figure(nfigure,figsize=(7,6))
+        vmax = np.abs([np.nanmedian(mask_flat) + np.nanstd(mask_flat),\
+            np.nanmedian(mask_flat) - np.nanstd(mask_flat)]).max()
+        vmin = -vmax
+
+        ax = fig.add_subplot(1,3,1)
+        cax = ax.imshow(mask,cmap=cmap,vmax=vmax,vmin=vmin)
+        ax.set_title('Original Mask')
+        plt.setp( ax.get_xticklabels(), visible=False)
+
+        ax = fig.add_subplot(1,3,2)
+        cax = ax.imshow(mask_flat,cmap=cmap,vmax=vmax,vmin=vmin)
+        ax.set_title('Flat Mask')
+        plt.setp( ax.get_xticklabels(), visible=False)
+        #cbar = fig.colorbar(cax, orientation='vertical',aspect=10)
+
+        ax = fig.add_subplot(1,3,3)
+        cax = ax.imshow(mask_flat_clean,cmap=cmap,vmax=vmax,vmin=vmin)
+        ax.set_title('Final Mask')
+        plt.setp( ax.get_xticklabels(), visible=False)
+        #cbar = fig.colorbar(cax, orientation='vertical',aspect=10)
+        fig.savefig('mask.eps', format='EPS',dpi=150)
     del mask_flat_clean
 
 # plot diplacements maps
-nfigure+=1
-fig = plt.figure(nfigure,figsize=(14,10))
-fig.subplots_adjust(wspace=0.001)
-vmax = np.nanpercentile(maps[:,:,:],99.)
-vmin = np.nanpercentile(maps[:,:,:],1.)
-# vmax = np.abs([np.nanmedian(maps[:,:,-1]) + 1.*np.nanstd(maps[:,:,-1]),\
-#     np.nanmedian(maps[:,:,-1]) - 1.*np.nanstd(maps[:,:,-1])]).max()
-# vmin = -vmax
-
-for l in range((N)):
-    d = as_strided(maps[:,:,l])
-    #ax = fig.add_subplot(1,N,l+1)
-    ax = fig.add_subplot(4,int(N/4)+1,l+1)
-    #cax = ax.imshow(d,cmap=cmap,vmax=vmax,vmin=vmin)ftem
-    cax = ax.imshow(d,cmap=cmap,vmax=vmax,vmin=vmin)
-    ax.set_title(idates[l],fontsize=6)
-    plt.setp( ax.get_xticklabels(), visible=False)
-    plt.setp( ax.get_yticklabels(), visible=False)
+if plot=='yes':
+    # display limits from a regular subsample of the pixels, all dates of
+    # each sampled pixel (about 1e6 values)
+    sample = maps.reshape(-1,N)[::max(1,new_lines*new_cols*N//1000000)]
+    vmin, vmax = np.nanpercentile(sample,[1.,99.])
+    del sample
+    # same color scale for all the time series panels
+    tsnorm = mcolors.Normalize(vmin=vmin,vmax=vmax)
 
-plt.suptitle('Time series maps')
-fig.colorbar(cax, orientation='vertical',aspect=10)
-fig.tight_layout()
-fig.savefig('maps.eps', format='EPS',dpi=150)
+    nfigure+=1
+    fig = plt.figure(nfigure,figsize=(14,10))
+    fig.subplots_adjust(wspace=0.001)
+    # vmax = np.abs([np.nanmedian(maps[:,:,-1]) + 1.*np.nanstd(maps[:,:,-1]),\
+    #     np.nanmedian(maps[:,:,-1]) - 1.*np.nanstd(maps[:,:,-1])]).max()
+    # vmin = -vmax
+
+    # tile all dates in one mosaic displayed with a single imshow
+    nrows, ncols = 4, int(N/4)+1
+    mosaic = np.full((nrows*new_lines,ncols*new_cols),np.nan,dtype=np.float32)
+    ax = fig.add_subplot(1,1,1)
+    for l in range((N)):
+        r, c = divmod(l,ncols)
+        mosaic[r*new_lines:(r+1)*new_lines,c*new_cols:(c+1)*new_cols] = maps[:,:,l]
+        ax.text(c*new_cols,r*new_lines,idates[l],fontsize=6,va='bottom')
+    cax = ax.imshow(mosaic,cmap=cmap,norm=tsnorm,interpolation='nearest')
+    ax.set_xticks([])
+    ax.set_yticks([])
+    del mosaic
+
+    plt.suptitle('Time series maps')
+    fig.colorbar(cax, orientation='vertical',aspect=10)
+    fig.subplots_adjust(left=0.02,right=0.98,bottom=0.02,top=0.93)
+    fig.savefig('maps.eps', format='EPS',dpi=150)
 
 
 if plot=='yes':
@@ -873,10 +878,9 @@ if arguments["--bianual"]=='yes':
      basis.append(sin5var(name='bi-anual var (sin)',reduction='sin5wt',date=datemin))
      index = index + 2
 
-indexco = np.zeros(len(cos))
+indexco = np.arange(index,index+len(cos))
 for i in range(len(cos)):
     basis.append(coseismic(name='coseismic {}'.format(i),reduction='cos{}'.format(i),date=cos[i])),
-    indexco[i] = index
     index = index + 1
     iteration=True
 
@@ -890,14 +894,13 @@ for i in range(len(pos)):
     index = index + 1
   else:
     indexpofull.append(0)
-indexpo = np.array(indexpo)
-indexpofull = np.array(indexpofull)
+indexpo = np.array(indexpo,dtype=int)
+indexpofull = np.array(indexpofull,dtype=int)
 
 
-indexsse = np.zeros(len(sse_time))
+indexsse = np.arange(index,index+len(sse_time))
 for i in range(len(sse_time)):
     basis.append(slowslip(name='sse {}'.format(i),reduction='sse{}'.format(i),date=sse_time[i],tcar=sse_car[i])),
-    indexsse[i] = int(index)
     index = index + 1
     iteration=True
 
@@ -909,32 +912,31 @@ if arguments["--dem"]=='yes':
    index = index + 1
 
 if arguments["--vector"] != None:
-    fig = plt.figure(nfigure,figsize=(6,4))
-    nfigure = nfigure + 1
-    indexvect = np.zeros(len(vectf))
+    if plot=='yes':
+      fig = plt.figure(nfigure,figsize=(6,4))
+      nfigure = nfigure + 1
+    # one column per vector file
+    vects = np.column_stack([np.loadtxt(f, comments='#', unpack = False, dtype='f').ravel() for f in vectf])
     for i in range(len(vectf)):
-      ax = fig.add_subplot(i+1,1,len(vectf))
-      v = np.loadtxt(vectf[i], comments='#', unpack = False, dtype='f')
-      kernels.append(vector(name=vectf[i],reduction='vector_{}'.format(i),vect=v))
-      ax.plot(v,label='Vector')
-      plt.legend(loc='best')
-      indexvect[i] = index
-      index = index + 1    
-    indexvect = indexvect.astype(int)
+      kernels.append(vector(name=vectf[i],reduction='vector_{}'.format(i),vect=vects[:,i]))
+      if plot=='yes':
+        ax = fig.add_subplot(i+1,1,len(vectf))
+        ax.plot(vects[:,i],label='Vector')
+        plt.legend(loc='best')
+    indexvect = np.arange(index,index+len(vectf))
+    index = index + len(vectf)
     if plot=='yes':
       plt.show()
     # sys.exit()
 
-indexpo = indexpo.astype(int)
-indexco = indexco.astype(int)
-indexsse = indexsse.astype(int)
-
 print()
 Mbasis=len(basis)
 logger.info('Number of basis functions: {}'.format(Mbasis))
 Mker=len(kernels)
 logger.info('Number of kernel functions: {}'.format(Mker))
 M = Mbasis + Mker
+# all functions but the postseismic ones, for the prior solution in consInvert
+indexnopo = np.setdiff1d(np.arange(M),indexpo)
 
 print('Basis functions, Time:')
 for i in range((Mbasis)):
@@ -944,13 +946,16 @@ if Mker > 1:
 for i in range((Mker)):
     kernels[i].info()
 
-# initialize matrix model to NaN
+# initialize matrix model to NaN: one (M,lines,cols) array for all functions,
+# basis[l].m and kernels[l].m are views on it
+m_maps = np.full((M,new_lines,new_cols),np.nan,dtype=np.float32)
+sigmam_maps = np.full((M,new_lines,new_cols),np.nan,dtype=np.float32)
 for l in range((Mbasis)):
-    basis[l].m = np.ones((new_lines,new_cols))*np.float('NaN')
-    basis[l].sigmam = np.ones((new_lines,new_cols))*np.float('NaN')
+    basis[l].m = m_maps[l]
+    basis[l].sigmam = sigmam_maps[l]
 for l in range((Mker)):
-    kernels[l].m = np.ones((new_lines,new_cols))*np.float('NaN')
-    kernels[l].sigmam = np.ones((new_lines,new_cols))*np.float('NaN')
+    kernels[l].m = m_maps[Mbasis+l]
+    kernels[l].sigmam = sigmam_maps[Mbasis+l]
 
 # initialize qual
 if apsf=='no':
@@ -963,29 +968,34 @@ else:
       percentile to avoid overweighting...')
     # maxinaps = np.nanmax(inaps)
     # inaps= inaps/maxinaps
-    minaps= np.nanpercentile(inaps,2)
-    index = np.flatnonzero(inaps<minaps)
-    inaps[index] = minaps
+    np.clip(inaps,np.nanpercentile(inaps,2),None,out=inaps)
     logger.info('Output uncertainties for first iteration: {}'.format(inaps))
     print
 
 # SVD inversion with cut-off eigenvalues
+def pinvSVD(A,cond):
+    # pseudo-inverse of A, masking eigenvalues smaller than cond
+    U,eignv,V = lst.svd(A, full_matrices=False, lapack_driver='gesdd', check_finite=False)
+    inv = np.zeros(len(eignv))
+    index = eignv>=float(cond)
+    inv[index] = 1./eignv[index]
+    return np.dot(V.T*inv, U.T)
+
 def invSVD(A,b,cond):
     try:
-        U,eignv,V = lst.svd(A, full_matrices=False)
-        s = np.diag(eignv)
-        index = np.nonzero(s<cond)
-        inv = lst.inv(s)
-        inv[index] = 0.
-        fsoln = np.dot( V.T, np.dot( inv , np.dot(U.T, b) ))
+        # one gelsd pass, redone with the cutoff only if some eigenvalues are smaller than cond
+        fsoln, res, rank, eignv = lst.lstsq(A, b, lapack_driver='gelsd', check_finite=False)
+        if eignv[-1] < float(cond):
+            fsoln = lst.lstsq(A, b, cond=float(cond)/eignv[0], lapack_driver='gelsd', check_finite=False)[0]
     except:
-        fsoln = lst.lstsq(A,b)[0]
+        # SVD did not converge: rank-revealing QR instead
+        fsoln = lst.lstsq(A,b,lapack_driver='gelsy')[0]
         #fsoln = lst.lstsq(A,b,rcond=cond)[0]
     
     return fsoln
 
 ## inversion procedure 
-def consInvert(A,b,sigmad,ineq='yes',cond=1.0e-3, iter=2000,acc=1e-12):
+def consInvert(A,b,sigmad,ineq='yes',cond=1.0e-3, iter=2000,acc=1e-12,diagvarx=None,pinvpo=None):
     '''Solves the constrained inversion problem.
 
     Minimize:
@@ -1006,52 +1016,181 @@ def consInvert(A,b,sigmad,ineq='yes',cond=1.0e-3, iter=2000,acc=1e-12):
     else:
         if len(indexpo>0):
           # prior solution without postseismic 
-          Ain = np.delete(A,indexpo,1)
-          mtemp = invSVD(Ain,b,cond) 
-          # rebuild full vector
-          for z in range(len(indexpo)):
-            mtemp = np.insert(mtemp,indexpo[z],0)
-          minit = np.copy(mtemp)
+          # rebuild full vector with zero postseismic
+          # pinvpo: pseudo-inverse of A[:,indexnopo] if already known
+          minit = np.zeros((A.shape[1]))
+          if pinvpo is None:
+              minit[indexnopo] = invSVD(A[:,indexnopo],b,cond)
+          else:
+              minit[indexnopo] = np.dot(pinvpo,b)
           # # initialize bounds
           mmin,mmax = -np.ones(len(minit))*np.inf, np.ones(len(minit))*np.inf 
 
           # We here define bounds for postseismic to be the same sign than coseismic
           # and coseismic inferior or egual to the coseimic initial 
           for i in range(len(indexco)):
-            if (pos[i] > 0.) and (minit[int(indexco[i])]>0.):
-                mmin[int(indexpofull[i])], mmax[int(indexpofull[i])] = 0, np.inf 
-                mmin[int(indexco[i])], mmax[int(indexco[i])] = 0, minit[int(indexco[i])] 
-            if (pos[i] > 0.) and (minit[int(indexco[i])]<0.):
-                mmin[int(indexpofull[i])], mmax[int(indexpofull[i])] = -np.inf , 0
-                mmin[int(indexco[i])], mmax[int(indexco[i])] = minit[int(indexco[i])], 0
-          bounds=zip(mmin,mmax)
+            if (pos[i] > 0.) and (minit[indexco[i]]>0.):
+                mmin[indexpofull[i]], mmax[indexpofull[i]] = 0, np.inf 
+                mmin[indexco[i]], mmax[indexco[i]] = 0, minit[indexco[i]] 
+            if (pos[i] > 0.) and (minit[indexco[i]]<0.):
+                mmin[indexpofull[i]], mmax[indexpofull[i]] = -np.inf , 0
+                mmin[indexco[i]], mmax[indexco[i]] = minit[indexco[i]], 0
+          bounds=(mmin,mmax)
         
         else:
-          minit=invSVD(A,b,cond)
-          bounds=None
+          bounds=(-np.inf,np.inf)
         
-        ####Objective function and derivative
-        _func = lambda x: np.sum(((np.dot(A,x)-b)/sigmad)**2)
-        _fprime = lambda x: 2*np.dot(A.T/sigmad, (np.dot(A,x)-b)/sigmad)
-        res = opt.fmin_slsqp(_func,minit,bounds=bounds,fprime=_fprime, \
-            iter=iter,full_output=True,iprint=0,acc=acc)  
-        fsoln = res[0]
+        #### weighted linear least-square with box constraints
+        # minimize sum(((Ax-b)/sigmad)**2)
+        res = opt.lsq_linear(A/sigmad[:,np.newaxis],b/sigmad,bounds=bounds, \
+            method='bvls',tol=acc,max_iter=iter)
+        fsoln = res.x
   
     # tarantola:
     # Cm = (Gt.Cov.G)-1 --> si sigma=1 problems
     # sigma m **2 =  misfit**2 * diag([G.TG]-1)
+    # diagvarx: diag([G.TG]-1) if already known for this G
     try:
-       varx = np.linalg.inv(np.dot(A.T,A))
+       if diagvarx is None:
+           diagvarx = np.diag(np.linalg.inv(np.dot(A.T,A)))
        # res2 = np.sum(pow((b-np.dot(A,fsoln))/sigmad,2))
        res2 = np.sum(pow((b-np.dot(A,fsoln)),2))
        scale = 1./(A.shape[0]-A.shape[1])
        # scale = 1./A.shape[0]
-       sigmam = np.sqrt(scale*res2*np.diag(varx))
+       sigmam = np.sqrt(scale*res2*diagvarx)
     except:
-       sigmam = np.ones((A.shape[1]))*float('NaN')
+       sigmam = np.full((A.shape[1]),np.nan)
 
     return fsoln,sigmam
 
+# empirical spatial models: columns as function of range, azimuth and elevation
+columns_func = {
+    '1': lambda r,az,z: np.ones(np.shape(r)),
+    'r': lambda r,az,z: r,
+    'r**2': lambda r,az,z: np.square(r),
+    'az': lambda r,az,z: az,
+    'az**2': lambda r,az,z: np.square(az),
+    'az**3': lambda r,az,z: np.square(az)*az,
+    'r*az': lambda r,az,z: r*az,
+    '(r*az)**2': lambda r,az,z: np.square(r*az),
+    'z': lambda r,az,z: z,
+    'z**2': lambda r,az,z: np.square(z),
+    'z*az': lambda r,az,z: z*az,
+    '(z*az)**2': lambda r,az,z: np.square(z*az),
+    }
+
+# ramp terms for each --flat order
+ramp_orders = {
+    0: [],
+    1: ['r','1'],
+    2: ['az','1'],
+    3: ['r','az','1'],
+    4: ['r','az','r*az','1'],
+    5: ['r**2','r','az','1'],
+    6: ['az**2','az','r','1'],
+    7: ['az**2','az','r**2','r','1'],
+    8: ['az**3','az**2','az','r**2','r','1'],
+    9: ['r','az','(r*az)**2','r*az','1'],
+    }
+
+# phase/topo terms for each (--ivar, --nfit)
+topo_terms = {
+    (0,0): ['z'],
+    (0,1): ['z','z**2'],
+    (1,0): ['z','z*az'],
+    (1,1): ['z*az','z','z**2'],
+    }
+
+topo_columns = ['z','z**2','z*az','(z*az)**2']
+
+def ramp_columns(order,ivar,nfit):
+    if arguments["--topofile"] is None:
+        return ramp_orders[order]
+    if order == 0:
+        # reference frame
+        return ['1'] + topo_terms[(ivar,nfit)]
+    columns = ramp_orders[order] + topo_terms[(ivar,nfit)]
+    if (ivar==1 and nfit==1) and order in (6,8):
+        columns = columns + ['(z*az)**2']
+    return columns
+
+def build_columns(columns,r,az,z,out=None):
+    # column-major: each column is filled and read contiguously
+    # out: optional (>=len(r), len(columns)) buffer to fill instead
+    if out is None:
+        G = np.empty((len(r),len(columns)),order='F')
+    else:
+        G = out[:len(r)]
+    for i in range(len(columns)):
+        if columns[i] == '1':
+            G[:,i] = 1.
+        else:
+            G[:,i] = columns_func[columns[i]](r,az,z)
+    return G
+
+def normal_equations(columns,r,az,z,data,rms,nblock=1000000):
+    # G.TG and G.Td of the problem weighted by 1/rms, summed over blocks
+    # of rows: G is never built for all the points
+    GtG, Gtd = np.zeros((len(columns),len(columns))), np.zeros((len(columns)))
+    w = np.broadcast_to(1./np.asarray(rms,dtype=np.float64),np.shape(data))
+    # one buffer for all blocks
+    buf = np.empty((min(nblock,len(data)),len(columns)),order='F')
+    for i in range(0,len(data),nblock):
+        sl = slice(i,i+nblock)
+        Gw = build_columns(columns,r[sl],az[sl],z[sl],out=buf)
+        Gw *= w[sl,np.newaxis]
+        GtG += np.dot(Gw.T,Gw)
+        Gtd += np.dot(Gw.T,data[sl]*w[sl])
+    return GtG, Gtd
+
+# terms of the azimuth or the range alone
+az_columns = ['az','az**2','az**3']
+r_columns = ['r','r**2']
+
+def eval_grid(columns,pars):
+    # columns weighted by pars on the full grid: terms of the azimuth or of
+    # the range alone are evaluated on one column/line and broadcast
+    az1, r1 = np.arange(new_lines)-ibeg_emp, np.arange(new_cols)-jbeg_emp
+    azpart = eval_columns([c for c in columns if c in az_columns],
+        [p for p,c in zip(pars,columns) if c in az_columns],az1,az1,az1)
+    rpart = eval_columns([c for c in columns if c in r_columns],
+        [p for p,c in zip(pars,columns) if c in r_columns],r1,r1,r1)
+    others = [i for i in range(len(columns)) if columns[i] not in az_columns+r_columns]
+    funct = eval_columns([columns[i] for i in others],[pars[i] for i in others],
+        rg_full,az_full,elevi,cache=full_columns).reshape(new_lines,new_cols)
+    funct += azpart[:,np.newaxis]
+    funct += rpart[np.newaxis,:]
+    return funct
+
+# full grid columns: same geometry for all dates, computed once
+# and stored in float32 (pars and sums stay in float64)
+full_columns = {}
+
+def eval_columns(columns,pars,r,az,z,cache=None):
+    # sum of the columns weighted by pars, without building G
+    funct = np.zeros(np.shape(r))
+    tmp = np.empty(np.shape(r))
+    for i in range(len(columns)):
+        if columns[i] == '1':
+            # constant term: no column to build
+            funct += pars[i]
+            continue
+        if cache is None:
+            col = columns_func[columns[i]](r,az,z)
+        else:
+            if columns[i] not in cache:
+                cache[columns[i]] = np.asarray(columns_func[columns[i]](r,az,z),dtype=np.float32)
+            col = cache[columns[i]]
+        np.multiply(col,pars[i],out=tmp)
+        funct += tmp
+    return funct
+
+def nanstd_dot(x):
+    # np.nanstd from the dot product of the centred valid values
+    v = np.asarray(x[~np.isnan(x)],dtype=np.float64)
+    v -= np.mean(v)
+    return np.sqrt(np.dot(v,v)/v.size)
+
 def estim_ramp(los,los_clean,topo_clean,az,rg,order,rms,nfit,ivar,l,ax_dphi):
 
       # global new_lines, new_cols
@@ -1072,13 +1211,16 @@ def estim_ramp(los,los_clean,topo_clean,az,rg,order,rms,nfit,ivar,l,ax_dphi):
           # digitize data in bins, compute median and std
           bins = np.arange(mintopo,maxtopo,abs(maxtopo-mintopo)/500.)
           inds = np.digitize(topo_clean,bins)
+          # sort points by bin once: each bin is then a contiguous slice
+          isort = np.argsort(inds,kind='stable')
+          bounds = np.searchsorted(inds[isort],np.arange(len(bins)))
           topobins = []
           losbins = []
           losstd = []
           azbins, rgbins = [], []
           los_clean2, topo_clean2, az_clean2, rg_clean2, rms_clean2 = [], [], [], [], []
           for j in range(len(bins)-1):
-                  uu = np.flatnonzero(inds == j)
+                  uu = isort[bounds[j]:bounds[j+1]]
                   if len(uu)>200:
                       topobins.append(bins[j] + (bins[j+1] - bins[j])/2.)
 
@@ -1120,2098 +1262,67 @@ def estim_ramp(los,los_clean,topo_clean,az,rg,order,rms,nfit,ivar,l,ax_dphi):
             logger.critical('Too small area for empirical phase/topo relationship. Re-defined crop values Exit!')
             sys.exit()
     
-      if order==0:
-
-        if arguments["--topofile"] is None:
-
-            a = 0.
-            ramp = np.zeros((new_lines,new_cols))
-            # rms = np.sqrt(np.nanmean((los)**2))
-            rms = np.nanstd(los)
-            logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-        else:
-
-            if (ivar==0 and nfit==0):
-                G=np.zeros((len(data),2))
-                G[:,0] = 1
-                G[:,1] = topobins
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]
-                logger.info('Remove ref frame %f + %f z for date: %i'%(a,b,idates[l]))
-
-                # plot phase/elev
-                funct = a
-                funcbins = a
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,b*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),2))
-                G[:,0] = 1
-                G[:,1] = elevi
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                topo = np.dot(G,pars).reshape(new_lines,new_cols)
-
-
-            elif (ivar==0 and nfit==1):
-                G=np.zeros((len(data),3))
-                G[:,0] = 1
-                G[:,1] = topobins
-                G[:,2] = topobins**2
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c=pars[2]
-                print ('Remove ref frame %f + %f z + %f z**2 for date: %i'%(a,b,c,idates[l]))
-
-                # plot phase/elev
-                funct = a
-                funcbins = a
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,b*x+c*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),3))
-                G[:,0] = 1
-                G[:,1] = elevi
-                G[:,2] = elevi**2
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                topo = np.dot(G,pars).reshape(new_lines,new_cols)
-
-            elif (ivar==1 and nfit==0):
-                G=np.zeros((len(data),3))
-                G[:,0] = 1
-                G[:,1] = topo_clean
-                G[:,2] = az*topo_clean
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]
-                print ('Remove ref frame %f + %f z + %f az*z for date: %i'%(a,b,c,idates[l]))
-
-                # plot phase/elev
-                funct = a + c*topo_clean*az
-                funcbins = a + c*topobins*azbins
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,b*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),3))
-                G[:,0] = 1
-                G[:,1] = elevi
-                G[:,2] = elevi
-                for i in range(nlines):
-                    G[i*new_cols:(i+1)*new_cols,2] *= (i - ibeg_emp)
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                topo = np.dot(G,pars).reshape(new_lines,new_cols)
-
-            elif (ivar==1 and nfit==1):
-                G=np.zeros((len(data),4))
-                G[:,0] = 1
-                G[:,1] = az*topo_clean
-                G[:,2] = topo_clean
-                G[:,3] = topo_clean**2
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,acc=1.e-9,iprint=0)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]
-                print ('Remove ref frame %f + %f az*z + %f z + %f z**2 for date: %i'%(a,b,c,d,idates[l]))
-
-                # plot phase/elev
-                funct = a + b*topo_clean*az
-                funcbins = a + b*topobins*azbins
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,c*x+d*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),4))
-                G[:,0] = 1
-                G[:,1] = elevi
-                G[:,2] = elevi
-                G[:,3] = elevi**2
-                for i in range(nlines):
-                    G[i*new_cols:(i+1)*new_cols,1] *= (i - ibeg_emp)
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                topo = np.dot(G,pars).reshape(new_lines,new_cols)
-
-      elif order==1: # Remove a range ramp ay+b for each maps (y = col)
-
-        if arguments["--topofile"] is None:
-            G=np.zeros((len(data),2))
-            G[:,0] = rg
-            G[:,1] = 1
-
-            # ramp inversion
-            x0 = lst.lstsq(G,data)[0]
-            _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-            _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-            pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-            a = pars[0]; b = pars[1]
-            print ('Remove ramp %f r + %f for date: %i'%(a,b,idates[l]))
-
-            # build total G matrix
-            G=np.zeros((len(los),2))
-            for i in range(nlines):
-                G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-            G[:,1] = 1
-
-            res = los - np.dot(G,pars)
-            #rms = np.sqrt(np.nanmean(res**2))
-            rms = np.nanstd(res)
-            logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-            ramp = np.dot(G,pars).reshape(new_lines,new_cols)
-
-        else:
-            if (ivar==0 and nfit==0):
-                G=np.zeros((len(data),3))
-                G[:,0] = rg
-                G[:,1] = 1
-                G[:,2] = topo_clean
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]
-                print ('Remove ramp %f r + %f + %f z for date: %i'%(a,b,c,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg + b
-                funcbins = a*rgbins + b
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,c*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),3))
-                for i in range(nlines):
-                    G[i*ncol:(i+1)*ncol,0] = np.arange((ncol)) - jbeg_emp
-                G[:,1] = 1
-                G[:,2] = elevi
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-1)],pars[:nparam-1]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-1):],pars[(nparam-1):]).reshape(new_lines,new_cols)
-
-            elif (ivar==0 and nfit==1):
-                G=np.zeros((len(data),4))
-                G[:,0] = rg
-                G[:,1] = 1
-                G[:,2] = topo_clean
-                G[:,3] = topo_clean**2
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d=pars[3]
-                print ('Remove ramp %f r + %f + %f z + %f z**2 for date: %i'%(a,b,c,d,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg+ b
-                funcbins = a*rgbins+ b
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,c*x+d*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),4))
-                for i in range(nlines):
-                    G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-                G[:,1] = 1
-                G[:,2] = elevi
-                G[:,3] = elevi**2
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-2)],pars[:nparam-2]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-2):],pars[(nparam-2):]).reshape(new_lines,new_cols)
-
-            elif (ivar==1 and nfit==0):
-                G=np.zeros((len(data),4))
-                G[:,0] = rg
-                G[:,1] = 1
-                G[:,2] = topo_clean
-                G[:,3] = topo_clean*az
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]
-                print ('Remove ramp %f r + %f + %f z + %f z*az for date: %i'%(a,b,c,d,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg+ b + d*topo_clean*az
-                funcbins = a*rgbins+ b + d*topobins*azbins
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,c*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),4))
-                G[:,1] = 1
-                G[:,2] = elevi
-                G[:,3] = elevi
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,3] *= (i - ibeg_emp)
-
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-2)],pars[:nparam-2]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-2):],pars[(nparam-2):]).reshape(new_lines,new_cols)
-
-            elif (ivar==1 and nfit==1):
-                G=np.zeros((len(data),5))
-                G[:,0] = rg
-                G[:,1] = 1
-                G[:,2] = topo_clean*az
-                G[:,3] = topo_clean
-                G[:,4] = topo_clean**2
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]
-                print ('Remove ramp %f r + %f +  %f z*az + %f z + %f z**2 for date: %i'%(a,b,c,d,e,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg+ b + c*topo_clean*az
-                funcbins = a*rgbins+ b + c*topobins*azbins
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,d*x+e*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),5))
-                G[:,1] = 1
-                G[:,2] = elevi
-                G[:,3] = elevi
-                G[:,4] = elevi**2
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] *= (i - ibeg_emp)
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-3)],pars[:nparam-3]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-3):],pars[(nparam-3):]).reshape(new_lines,new_cols)
-
-
-      elif order==2: # Remove a azimutal ramp ax+b for each maps (x is lign)
-        if arguments["--topofile"] is None:
-            G=np.zeros((len(data),2))
-            G[:,0] = az
-            G[:,1] = 1
-
-            # ramp inversion
-            x0 = lst.lstsq(G,data)[0]
-            _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-            _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-            pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-            a = pars[0]; b = pars[1]
-            print ('Remove ramp %f az + %f for date: %i'%(a,b,idates[l]))
-
-            # build total G matrix
-            G=np.zeros((len(los),2))
-            for i in range(new_lines):
-                G[i*new_cols:(i+1)*new_cols,0] =(i - ibeg_emp)
-            G[:,1] = 1
-
-
-            res = los - np.dot(G,pars)
-            #rms = np.sqrt(np.nanmean(res**2))
-            rms = np.nanstd(res)
-            logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-            ramp = np.dot(G,pars).reshape(new_lines,new_cols)
+      # model columns: ramp terms, then phase/topo terms
+      columns = ramp_columns(order,ivar,nfit)
 
-        else:
-            if (ivar==0 and nfit==0):
-                G=np.zeros((len(data),3))
-                G[:,0] = az
-                G[:,1] = 1
-                G[:,2] = topo_clean
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]
-                print ('Remove ramp %f az + %f + %f z for date: %i'%(a,b,c,idates[l]))
-
-                # plot phase/elev
-                funct = a*az + b
-                funcbins = a*azbins + b
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,c*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),3))
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] =(i - ibeg_emp)
-                G[:,1] = 1
-                G[:,2] = elevi
-
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-1)],pars[:nparam-1]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-1):],pars[(nparam-1):]).reshape(new_lines,new_cols)
-
-            elif (ivar==0 and nfit==1):
-                G=np.zeros((len(data),4))
-                G[:,0] = az
-                G[:,1] = 1
-                G[:,2] = topo_clean
-                G[:,3] = topo_clean**2
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]
-                print ('Remove ramp %f az + %f + %f z + %f z**2 for date: %i'%(a,b,c,d,idates[l]))
-
-                # plot phase/elev
-                funct = a*az + b
-                funcbins = a*azbins + b
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,c*x + d*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),4))
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] =(i - ibeg_emp)
-                G[:,1] = 1
-                G[:,2] = elevi
-                G[:,3] = elevi**2
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-2)],pars[:nparam-2]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-2):],pars[(nparam-2):]).reshape(new_lines,new_cols)
-
-            elif (ivar==1 and nfit==0):
-                G=np.zeros((len(data),4))
-                G[:,0] = az
-                G[:,1] = 1
-                G[:,2] = topo_clean
-                G[:,3] = topo_clean*az
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]
-                print ('Remove ramp %f az + %f + %f z + %f z*az for date: %i'%(a,b,c,d,idates[l]))
-
-                # plot phase/elev
-                funct = a*az + b + d*topo_clean*az
-                funcbins = a*azbins + b + d*topobins*azbins
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,c*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),4))
-                G[:,1] = 1
-                G[:,2] = elevi
-                G[:,3] = elevi
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = i - ibeg_emp
-                    G[i*new_cols:(i+1)*new_cols,3] *= (i - ibeg_emp)
-
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-2)],pars[:nparam-2]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-2):],pars[(nparam-2):]).reshape(new_lines,new_cols)
-
-            elif (ivar==1 and nfit==1):
-                G=np.zeros((len(data),5))
-                G[:,0] = az
-                G[:,1] = 1
-                G[:,2] = topo_clean*az
-                G[:,3] = topo_clean
-                G[:,4] = topo_clean**2
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]
-                print ('Remove ramp %f az + %f + %f z*az + %f z + %f z**2 for date: %i'%(a,b,c,d,e,idates[l]))
-
-                # plot phase/elev
-                funct = a*az + b + c*topo_clean*az
-                funcbins = a*azbins + b + c*topobins*azbins
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,d*x+e*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),5))
-                G[:,1] = 1
-                G[:,2] = elevi
-                G[:,3] = elevi
-                G[:,4] = elevi**2
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = i - ibeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] *= (i - ibeg_emp)
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-3)],pars[:nparam-3]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-3):],pars[(nparam-3):]).reshape(new_lines,new_cols)
-
-      elif order==3: # Remove a ramp ay+bx+c for each maps
-        if arguments["--topofile"] is None:
-            G=np.zeros((len(data),3))
-            G[:,0] = rg
-            G[:,1] = az
-            G[:,2] = 1
-
-            # ramp inversion
-            x0 = lst.lstsq(G,data)[0]
-            # print x0
-            # x0 = np.zeros((3))
-            _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-            _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-            pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-            a = pars[0]; b = pars[1]; c = pars[2]
-            print ('Remove ramp %f r  + %f az + %f for date: %i'%(a,b,c,idates[l]))
-
-            # build total G matrix
-            G=np.zeros((len(los),3))
-            for i in range(new_lines):
-                G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-                G[i*new_cols:(i+1)*new_cols,1] = (i - ibeg_emp)
-            G[:,2] = 1
-
-            res = los - np.dot(G,pars)
-            #rms = np.sqrt(np.nanmean(res**2))
-            rms = np.nanstd(res)
-            logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-            ramp = np.dot(G,pars).reshape(new_lines,new_cols)
-
-        else:
-            if (ivar==0 and nfit==0):
-                G=np.zeros((len(data),4))
-                G[:,0] = rg
-                G[:,1] = az
-                G[:,2] = 1
-                G[:,3] = topo_clean
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]
-                print ('Remove ramp %f r  + %f az + %f + %f z for date: %i'%(a,b,c,d,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg+ b*az + c
-                funcbins = a*rgbins+ b*azbins + c
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,d*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),4))
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,1] =(i - ibeg_emp)
-                G[:,2] = 1
-                G[:,3] = elevi
-
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-1)],pars[:nparam-1]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-1):],pars[(nparam-1):]).reshape(new_lines,new_cols)
-
-            elif (ivar==0 and nfit==1):
-                G=np.zeros((len(data),5))
-                G[:-1,0] = rg
-                G[:-1,1] = az
-                G[:,2] = 1
-                G[:-1,3] = topo_clean
-                G[:-1,4] = topo_clean**2
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]
-                print ('Remove ramp %f r  + %f az + %f + %f z + %f z**2 for date: %i'%(a,b,c,d,e,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg+ b*az + c
-                funcbins = a*rgbins+ b*azbins + c
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,d*x+e*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),5))
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,1] =(i - ibeg_emp)
-                G[:,2] = 1
-                G[:,3] = elevi
-                G[:,4] = elevi**2
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-2)],pars[:nparam-2]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-2):],pars[(nparam-2):]).reshape(new_lines,new_cols)
-
-            elif (ivar==1 and nfit==0):
-                G=np.zeros((len(data),5))
-                G[:,0] = rg
-                G[:,1] = az
-                G[:,2] = 1
-                G[:,3] = topo_clean
-                G[:,4] = topo_clean*az
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                # print x0
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                # print pars - x0
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e=pars[4]
-                print ('Remove ramp %f r  + %f az + %f + %f z +  %f z*az for date: %i'%(a,b,c,d,e,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg+ b*az + c + e*topo_clean*az
-                funcbins = a*rgbins+ b*azbins + c + e*topobins*azbins
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,d*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),5))
-                G[:,2] = 1
-                G[:,3] = elevi
-                G[:,4] = elevi
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,1] =(i - ibeg_emp)
-                    G[i*new_cols:(i+1)*new_cols,4] *= (i - ibeg_emp)
-
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-2)],pars[:nparam-2]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-2):],pars[(nparam-2):]).reshape(new_lines,new_cols)
-
-            elif (ivar==1 and nfit==1):
-                G=np.zeros((len(data),6))
-                G[:,0] = rg
-                G[:,1] = az
-                G[:,2] = 1
-                G[:,3] = topo_clean*az
-                G[:,4] = topo_clean
-                G[:,5] = topo_clean**2
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e=pars[4]; f=pars[5]
-                print ('Remove ramp %f r  + %f az + %f +  %f z*az + %f z + %f z**2 for date: %i'%(a,b,c,d,e,f,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg+ b*az + c + d*topo_clean*az
-                funcbins = a*rgbins+ b*azbins + c + d*topobins*azbins
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.1, alpha=0.01, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,e*x+f*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),6))
-                G[:,2] = 1
-                G[:,3] = elevi
-                G[:,4] = elevi
-                G[:,5] = elevi**2
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,1] =(i - ibeg_emp)
-                    G[i*new_cols:(i+1)*new_cols,3] *= (i - ibeg_emp)
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-3)],pars[:nparam-3]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-3):],pars[(nparam-3):]).reshape(new_lines,new_cols)
-
-      elif order==4:
-        if arguments["--topofile"] is None:
-            G=np.zeros((len(data),4))
-            G[:,0] = rg
-            G[:,1] = az
-            G[:,2] = rg*az
-            G[:,3] = 1
-
-            # ramp inversion
-            x0 = lst.lstsq(G,data)[0]
-            _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-            _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-            pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-            a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]
-            print ('Remove ramp %f r %f az  + %f r*az + %f for date: %i'%(a,b,c,d,idates[l]))
-
-            # build total G matrix
-            G=np.zeros((len(los),4))
-            for i in range(new_lines):
-                G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-                G[i*new_cols:(i+1)*new_cols,1] = i - ibeg_emp
-                G[i*new_cols:(i+1)*new_cols,2] = (i-ibeg_emp) * (np.arange((new_cols))-jbeg_emp)
-            G[:,3] = 1
-
-            res = los - np.dot(G,pars)
-            #rms = np.sqrt(np.nanmean(res**2))
-            rms = np.nanstd(res)
-            logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-            ramp = np.dot(G,pars).reshape(new_lines,new_cols)
-
-        else:
-            if (ivar==0 and nfit==0):
-                G=np.zeros((len(data),5))
-                G[:,0] = rg
-                G[:,1] = az
-                G[:,2] = rg*az
-                G[:,3] = 1
-                G[:,4] = topo_clean
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]
-
-                print ('Remove ramp %f r, %f az  + %f r*az + %f + %f z for date: %i'%(a,b,c,d,e,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg+ b*az + c*az*rg+ d
-                funcbins = a*rgbins+ b*azbins + c*azbins*rgbins+ d
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,e*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),5))
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,1] = i - ibeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] = (i-ibeg_emp) * (np.arange((new_cols))-jbeg_emp)
-                G[:,3] = 1
-                G[:,4] = elevi
-
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-1)],pars[:nparam-1]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-1):],pars[(nparam-1):]).reshape(new_lines,new_cols)
-
-            elif (ivar==0 and nfit==1):
-                G=np.zeros((len(data),6))
-                G[:,0] = rg
-                G[:,1] = az
-                G[:,2] = rg*az
-                G[:,3] = 1
-                G[:,4] = topo_clean
-                G[:,5] = topo_clean**2
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]
-
-                print ('Remove ramp %f r, %f az  + %f r*az + %f + %f z + %f z**2 for date: %i'%(a,b,c,d,e,f,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg+ b*az + c*az*rg+ d
-                funcbins = a*rgbins+ b*azbins + c*azbins*rgbins+ d
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,e*x+f*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),5))
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,1] = i - ibeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] = (i-ibeg_emp) * (np.arange((new_cols))-jbeg_emp)
-                G[:,3] = 1
-                G[:,4] = elevi
-                G[:,5] = elevi**2
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-2)],pars[:nparam-2]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-2):],pars[(nparam-2):]).reshape(new_lines,new_cols)
-
-            elif (ivar==1 and nfit==0):
-                G=np.zeros((len(data),6))
-                G[:,0] = rg
-                G[:,1] = az
-                G[:,2] = rg*az
-                G[:,3] = 1
-                G[:,4] = topo_clean
-                G[:,5] = topo_clean*az
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]
-
-                print ('Remove ramp %f r, %f az  + %f r*az + %f + %f z + %f az*z for date: %i'%(a,b,c,d,e,f,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg+ b*az + c*az*rg+ d + f*topo_clean*az
-                funcbins = a*rgbins+ b*azbins + c*azbins*rgbins+ d + f*topobins*azbins
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,e*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),6))
-                G[:,3] = 1
-                G[:,4] = elevi
-                G[:,5] = elevi
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,1] = i - ibeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] = (i-ibeg_emp) * (np.arange((new_cols))-jbeg_emp)
-                    G[i*new_cols:(i+1)*new_cols,5] *=  (i - ibeg_emp)
-
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-2)],pars[:nparam-2]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-2):],pars[(nparam-2):]).reshape(new_lines,new_cols)
-
-            elif (ivar==1 and nfit==1):
-                G=np.zeros((len(data),6))
-                G[:,0] = rg
-                G[:,1] = az
-                G[:,2] = rg*az
-                G[:,3] = 1
-                G[:,4] = topo_clean*az
-                G[:,5] = topo_clean
-                G[:,6] = topo_clean**2
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]; g = pars[6]
-
-                print ('Remove ramp %f r, %f az  + %f r*az + %f + + %f az*z +  %f z + %f z**2  for date: %i'%(a,b,c,d,e,f,g,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg+ b*az + c*az*rg+ d + e*topo_clean*az
-                funcbins = a*rgbins+ b*azbins + c*azbins*rgbins+ d + e*topobins*azbins
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,f*x+g*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),7))
-                G[:,3] = 1
-                G[:,4] = elevi
-                G[:,5] = elevi
-                G[:,6] = elevi**2
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,1] = i - ibeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] = (i-ibeg_emp) * (np.arange((new_cols))-jbeg_emp)
-                    G[i*new_cols:(i+1)*new_cols,4] *=  (i - ibeg_emp)
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-3)],pars[:nparam-3]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-3):],pars[(nparam-3):]).reshape(new_lines,new_cols)
-
-      elif order==5:
-
-        if arguments["--topofile"] is None:
-            G=np.zeros((len(data),4))
-            G[:,0] = rg**2
-            G[:,1] = rg
-            G[:,2] = az
-            G[:,3] = 1
-
-            # ramp inversion
-            x0 = lst.lstsq(G,data)[0]
-            _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-            _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-            pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-            a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]
-            print ('Remove ramp %f r**2 + %f r  + %f az + %f for date: %i'%(a,b,c,d,idates[l]))
-
-            # build total G matrix
-            G=np.zeros((len(los),4))
-            for i in range(new_lines):
-                G[i*new_cols:(i+1)*new_cols,0] = (np.arange((new_cols)) - jbeg_emp)**2
-                G[i*new_cols:(i+1)*new_cols,1] = np.arange((new_cols)) - jbeg_emp
-                G[i*new_cols:(i+1)*new_cols,2] =(i - ibeg_emp)
-            G[:,3] = 1
-
-
-            res = los - np.dot(G,pars)
-            #rms = np.sqrt(np.nanmean(res**2))
-            rms = np.nanstd(res)
-            logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-            ramp = np.dot(G,pars).reshape(new_lines,new_cols)
-
-        else:
-
-            if (ivar==0 and nfit==0):
-
-                G=np.zeros((len(data),5))
-                G[:,0] = rg**2
-                G[:,1] = rg
-                G[:,2] = az
-                G[:,3] = 1
-                G[:,4] = topo_clean
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]
-                print ('Remove ramp %f r**2 + %f r  + %f az + %f + %f z for date: %i'%(a,b,c,d,e,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg**2 + b*rg+ c*az + d
-                funcbins = a*rgbins**2 + b*rgbins+ c*azbins + d
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,e*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),5))
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = (np.arange((new_cols)) - jbeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,1] = np.arange((new_cols)) -  jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] =(i - ibeg_emp)
-                G[:,3] = 1
-                G[:,4] = elevi
-
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-1)],pars[:nparam-1]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-1):],pars[(nparam-1):]).reshape(new_lines,new_cols)
-
-            elif (ivar==0 and nfit==1):
-                G=np.zeros((len(data),6))
-                G[:,0] = rg**2
-                G[:,1] = rg
-                G[:,2] = az
-                G[:,3] = 1
-                G[:,4] = topo_clean
-                G[:,5] = topo_clean**2
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]
-                print ('Remove ramp %f r**2 + %f r  + %f az + %f + %f z + %f z**2 for date: %i'%(a,b,c,d,e,f,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg**2 + b*rg+ c*az + d
-                funcbins = a*rgbins**2 + b*rgbins+ c*azbins + d
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,e*x+f*x**2,'-r', lw =4.)
-
-
-                # build total G matrix
-                G=np.zeros((len(los),6))
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = (np.arange((new_cols)) - jbeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,1] = np.arange((new_cols)) -  jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] =(i - ibeg_emp)
-                G[:,3] = 1
-                G[:,4] = elevi
-                G[:,5] = elevi**2
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-2)],pars[:nparam-2]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-2):],pars[(nparam-2):]).reshape(new_lines,new_cols)
-
-            elif (ivar==1 and nfit==0):
-
-                G=np.zeros((len(data),6))
-                G[:,0] = rg**2
-                G[:,1] = rg
-                G[:,2] = az
-                G[:,3] = 1
-                G[:,4] = topo_clean
-                G[:,5] = topo_clean*az
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]
-                print ('Remove ramp %f r**2 + %f r  + %f az + %f + %f z + %f z*az for date: %i'%(a,b,c,d,e,f,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg**2 + b*rg+ c*az + d + f*topo_clean*az
-                funcbins = a*rgbins**2 + b*rgbins+ c*azbins + d + f*topobins*azbins
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,e*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),6))
-                G[:,3] = 1
-                G[:,4] = elevi
-                G[:,5] = elevi
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = (np.arange((new_cols)) - jbeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,1] = np.arange((new_cols)) -  jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] =(i - ibeg_emp)
-                    G[i*new_cols:(i+1)*new_cols,5] *= (i - ibeg_emp)
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-2)],pars[:nparam-2]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-2):],pars[(nparam-2):]).reshape(new_lines,new_cols)
-
-
-            elif (ivar==1 and nfit==1):
-
-                G=np.zeros((len(data),7))
-                G[:,0] = rg**2
-                G[:,1] = rg
-                G[:,2] = az
-                G[:,3] = 1
-                G[:,4] = topo_clean*az
-                G[:,5] = topo_clean
-                G[:,6] = topo_clean**2
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]; g = pars[6]
-                print ('Remove ramp %f r**2 + %f r  + %f az + %f + + %f z*az + %f z +%f z**2 for date: %i'%(a,b,c,d,e,f,g,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg**2 + b*rg+ c*az + d + e*topo_clean*az
-                funcbins = a*rgbins**2 + b*rgbins+ c*azbins + d + e*topobins*azbins
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,f*x+g*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),7))
-                G[:,3] = 1
-                G[:,4] = elevi
-                G[:,5] = elevi
-                G[:,6] = elevi**2
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = (np.arange((new_cols)) - jbeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,1] = np.arange((new_cols)) -  jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] =(i - ibeg_emp)
-                    G[i*new_cols:(i+1)*new_cols,4] *= (i - ibeg_emp)
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-3)],pars[:nparam-3]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-3):],pars[(nparam-3):]).reshape(new_lines,new_cols)
-
-            else:
-                pass
-
-      elif order==6:
-        if arguments["--topofile"] is None:
-            G=np.zeros((len(data),4))
-            G[:,0] = az**2
-            G[:,1] = az
-            G[:,2] = rg
-            G[:,3] = 1
-
-            # ramp inversion
-            x0 = lst.lstsq(G,data)[0]
-            _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-            _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-            pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-            a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]
-            print ('Remove ramp %f az**2 + %f az  + %f r + %f for date: %i'%(a,b,c,d,idates[l]))
-
-            # build total G matrix
-            G=np.zeros((len(los),4))
-            for i in range(new_lines):
-                G[i*new_cols:(i+1)*new_cols,0] = (i - ibeg_emp)**2
-                G[i*new_cols:(i+1)*new_cols,1] = (i - ibeg_emp)
-                G[i*new_cols:(i+1)*new_cols,2] = np.arange((new_cols)) - jbeg_emp
-            G[:,3] = 1
-
-
-            res = los - np.dot(G,pars)
-            #rms = np.sqrt(np.nanmean(res**2))
-            rms = np.nanstd(res)
-            logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-            ramp = np.dot(G,pars).reshape(new_lines,new_cols)
-
-        else:
-            if (ivar==0 and nfit==0) :
-                G=np.zeros((len(data),5))
-                G[:,0] = az**2
-                G[:,1] = az
-                G[:,2] = rg
-                G[:,3] = 1
-                G[:,4] = topo_clean
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]
-                print ('Remove ramp %f az**2 + %f az  + %f r + %f + %f z for date: %i'%(a,b,c,d,e,idates[l]))
-
-                # plot phase/elev
-                funct = a*az**2 + b*az + c*rg+ d
-                funcbins = a*azbins**2 + b*azbins + c*rgbins+ d
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,e*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),5))
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = (i - ibeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,1] = i -  ibeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] = np.arange((new_cols)) - jbeg_emp
-                G[:,3] = 1
-                G[:,4] = elevi
-
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-1)],pars[:nparam-1]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-1):],pars[(nparam-1):]).reshape(new_lines,new_cols)
-
-            elif (ivar==0 and nfit==1):
-                G=np.zeros((len(data),6))
-                G[:,0] = az**2
-                G[:,1] = az
-                G[:,2] = rg
-                G[:,3] = 1
-                G[:,4] = topo_clean
-                G[:,5] = topo_clean**2
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]
-                print ('Remove ramp %f az**2 + %f az  + %f r + %f + %f z + %f z**2 for date: %i'%(a,b,c,d,e,f,idates[l]))
-
-                # plot phase/elev
-                funct = a*az**2 + b*az + c*rg+ d
-                funcbins = a*azbins**2 + b*azbins + c*rgbins+ d
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,e*x+f*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),6))
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = (i - ibeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,1] = i -  ibeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] = np.arange((new_cols)) - jbeg_emp
-                G[:,3] = 1
-                G[:,4] = elevi
-                G[:,5] = elevi**2
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-2)],pars[:nparam-2]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-2):],pars[(nparam-2):]).reshape(new_lines,new_cols)
-
-            elif (ivar==1 and nfit==0):
-                G=np.zeros((len(data),6))
-                G[:,0] = az**2
-                G[:,1] = az
-                G[:,2] = rg
-                G[:,3] = 1
-                G[:,4] = topo_clean
-                G[:,5] = topo_clean*az
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]
-                print ('Remove ramp %f az**2 + %f az  + %f r + %f + %f z + %f z*az for date: %i'%(a,b,c,d,e,f,idates[l]))
-
-                # plot phase/elev
-                funct = a*az**2 + b*az + c*rg+ d + f*topo_clean*az
-                funcbins = a*azbins**2 + b*azbins + c*rgbins+ d + f*topobins*azbins
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,e*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),6))
-                G[:,3] = 1
-                G[:,4] = elevi
-                G[:,5] = elevi
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = (i - ibeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,1] = i -  ibeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,5] *= (i - ibeg_emp)
-
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-2)],pars[:nparam-2]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-2):],pars[(nparam-2):]).reshape(new_lines,new_cols)
-
-            elif (ivar==1 and nfit==1):
-                G=np.zeros((len(data),8))
-                G[:,0] = az**2
-                G[:,1] = az
-                G[:,2] = rg
-                G[:,3] = 1
-                G[:,4] = topo_clean*az
-                G[:,5] = topo_clean
-                G[:,6] = topo_clean**2
-                G[:,7] = (topo_clean*az)**2
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]; g=pars[6]; h = pars[7]
-                print ('Remove ramp %f az**2 + %f az  + %f r + %f + %f z*az + %f z + %f z**2 + %f (z*az)**2 for date: %i'%(a,b,c,d,e,f,g,h,idates[l]))
-
-                # plot phase/elev
-                funct = a*az**2 + b*az + c*rg+ d + e*topo_clean*az + h*(topo_clean*az)**2
-                funcbins = a*azbins**2 + b*azbins + c*rgbins+ d + e*topobins*azbins + h*(topobins*azbins)**2
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,f*x+g*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),8))
-                G[:,3] = 1
-                G[:,4] = elevi
-                G[:,5] = elevi
-                G[:,6] = elevi**2
-                G[:,7] = elevi**2
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = (i - ibeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,1] = i -  ibeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,4] *= (i - ibeg_emp)
-                    G[i*new_cols:(i+1)*new_cols,7] *= (i - ibeg_emp)**2
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-3)],pars[:nparam-3]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-3):],pars[(nparam-3):]).reshape(new_lines,new_cols)
-
-
-      elif order==7:
-        if arguments["--topofile"] is None:
-            G=np.zeros((len(data),5))
-            G[:,0] = az**2
-            G[:,1] = az
-            G[:,2] = rg**2
-            G[:,3] = rg
-            G[:,4] = 1
-
-            # ramp inversion
-            x0 = lst.lstsq(G,data)[0]
-            _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-            _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-            pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-            a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]
-            print ('Remove ramp %f az**2 + %f az  + %f r**2 + %f r + %f for date: %i'%(a,b,c,d,e,idates[l]))
-
-            # build total G matrix
-            G=np.zeros((len(los),5))
-            for i in range(new_lines):
-                G[i*new_cols:(i+1)*new_cols,0] = (i - ibeg_emp)**2
-                G[i*new_cols:(i+1)*new_cols,1] = i - ibeg_emp
-                G[i*new_cols:(i+1)*new_cols,2] = (np.arange((new_cols)) - jbeg_emp)**2
-                G[i*new_cols:(i+1)*new_cols,3] = np.arange((new_cols)) - jbeg_emp
-            G[:,4] = 1
-
-
-            res = los - np.dot(G,pars)
-            #rms = np.sqrt(np.nanmean(res**2))
-            rms = np.nanstd(res)
-            logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-            ramp = np.dot(G,pars).reshape(new_lines,new_cols)
-
-        else:
-            if (ivar==0 and nfit ==0):
-                G=np.zeros((len(data),6))
-                G[:,0] = az**2
-                G[:,1] = az
-                G[:,2] = rg**2
-                G[:,3] = rg
-                G[:,4] = 1
-                G[:,5] = topo_clean
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]
-                print ('Remove ramp %f az**2 + %f az  + %f r**2 + %f r + %f + %f z for date: %i'%(a,b,c,d,e,f,idates[l]))
-
-                # plot phase/elev
-                funct = a*az**2 + b*az + c*rg**2 + d*az+ e
-                funcbins = a*azbins**2 + b*azbins + c*rgbins**2 + d*rgbins+ e
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,f*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),6))
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = (i - ibeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,1] = i - ibeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] = (np.arange((new_cols)) - jbeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,3] = np.arange((new_cols)) - jbeg_emp
-                G[:,4] = 1
-                G[:,5] = elevi
-
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-1)],pars[:nparam-1]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-1):],pars[(nparam-1):]).reshape(new_lines,new_cols)
-
-            if (ivar==0 and nfit ==1):
-                G=np.zeros((len(data),7))
-                G[:,0] = az**2
-                G[:,1] = az
-                G[:,2] = rg**2
-                G[:,3] = rg
-                G[:,4] = 1
-                G[:,5] = topo_clean
-                G[:,6] = topo_clean**2
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]; g = pars[6]
-                print ('Remove ramp %f az**2 + %f az  + %f r**2 + %f r + %f + %f z + %f z**2  for date: %i'%(a,b,c,d,e,f,g,idates[l]))
-
-                # plot phase/elev
-                funct = a*az**2 + b*az + c*rg**2 + d*rg+ e
-                funcbins = a*azbins**2 + b*azbins + c*rgbins**2 + d*rgbins+ e
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,f*x+g*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),7))
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = (i - ibeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,1] = i - ibeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] = (np.arange((new_cols)) - jbeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,3] = np.arange((new_cols)) - jbeg_emp
-                G[:,4] = 1
-                G[:,5] = elevi
-                G[:,6] = elevi**2
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-2)],pars[:nparam-2]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-2):],pars[(nparam-2):]).reshape(new_lines,new_cols)
-
-            elif (ivar==1 and nfit ==0):
-                G=np.zeros((len(data),7))
-                G[:,0] = az**2
-                G[:,1] = az
-                G[:,2] = rg**2
-                G[:,3] = rg
-                G[:,4] = 1
-                G[:,5] = topo_clean
-                G[:,6] = topo_clean*az
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]; g=pars[6]
-                print ('Remove ramp %f az**2 + %f az  + %f r**2 + %f r + %f + %f z + %f az*z for date: %i'%(a,b,c,d,e,f,g,idates[l]))
-
-                # plot phase/elev
-                funct = a*az**2 + b*az + c*rg**2 + d*rg+ e + g*topo_clean*az
-                funcbins = a*azbins**2 + b*azbins + c*rgbins**2 + d*rgbins+ e + g*topobins*azbins
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,f*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),7))
-                G[:,4] = 1
-                G[:,5] = elevi
-                G[:,6] = elevi
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = (i - ibeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,1] = i - ibeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] = (np.arange((new_cols)) - jbeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,3] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,6] *= (i - ibeg_emp)
-
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-2)],pars[:nparam-2]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-2):],pars[(nparam-2):]).reshape(new_lines,new_cols)
-
-            elif (ivar==1 and nfit==1):
-                G=np.zeros((len(data),8))
-                G[:,0] = az**2
-                G[:,1] = az
-                G[:,2] = rg**2
-                G[:,3] = rg
-                G[:,4] = 1
-                G[:,5] = topo_clean*az
-                G[:,6] = topo_clean
-                G[:,7] = topo_clean**2
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]; g=pars[6]; h=pars[7]
-                print ('Remove ramp %f az**2 + %f az  + %f r**2 + %f r + %f +  %f az*z + %f z + %f z**2 for date: %i'%(a,b,c,d,e,f,g,h,idates[l]))
-
-                # plot phase/elev
-                funct = a*az**2 + b*az + c*rg**2 + d*rg+ e + f*topo_clean*az
-                funcbins = a*azbins**2 + b*azbins + c*rgbins**2 + d*rgbins+ e + f*topobins*azbins
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,g*x+h*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),8))
-                G[:,4] = 1
-                G[:,5] = elevi
-                G[:,6] = elevi
-                G[:,7] = elevi**2
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = (i - ibeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,1] = i - ibeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] = (np.arange((new_cols)) - jbeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,3] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,5] *= (i - ibeg_emp)
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-3)],pars[:nparam-3]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-3):],pars[(nparam-3):]).reshape(new_lines,new_cols)
-
-      elif order==8:
-        if arguments["--topofile"] is None:
-            G=np.zeros((len(data),6))
-            G[:,0] = az**3
-            G[:,1] = az**2
-            G[:,2] = az
-            G[:,3] = rg**2
-            G[:,4] = rg
-            G[:,5] = 1
-
-            # ramp inversion
-            x0 = lst.lstsq(G,data)[0]
-            _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-            _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-            pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-            a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]
-            print ('Remove ramp %f az**3 + %f az**2  + %f az + %f r**2 + %f r + %f for date: %i'%(a,b,c,d,e,f,idates[l]))
-
-            # build total G matrix
-            G=np.zeros((len(los),6))
-            for i in range(new_lines):
-                G[i*new_cols:(i+1)*new_cols,0] = (i - ibeg_emp)**3
-                G[i*new_cols:(i+1)*new_cols,1] = (i - ibeg_emp)**2
-                G[i*new_cols:(i+1)*new_cols,2] =(i - ibeg_emp)
-                G[i*new_cols:(i+1)*new_cols,3] = (np.arange((new_cols)) - jbeg_emp)**2
-                G[i*new_cols:(i+1)*new_cols,4] = (np.arange((new_cols)) - jbeg_emp)
-            G[:,5] = 1
-
-
-            res = los - np.dot(G,pars)
-            #rms = np.sqrt(np.nanmean(res**2))
-            rms = np.nanstd(res)
-            logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-            ramp = np.dot(G,pars).reshape(new_lines,new_cols)
-
-        else:
-            if (ivar==0 and nfit==0):
-                G=np.zeros((len(data),7))
-                G[:,0] = az**3
-                G[:,1] = az**2
-                G[:,2] = az
-                G[:,3] = rg**2
-                G[:,4] = rg
-                G[:,5] = 1
-                G[:,6] = topo_clean
-
-                # ramp inversion1
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]; g = pars[6]
-                print ('Remove ramp %f az**3 + %f az**2  + %f az + %f r**2 + %f r + %f + %f z for date: %i'%(a,b,c,d,e,f,g,idates[l]))
-
-                # plot phase/elev
-                funct = a*az**3 + b*az**2 + c*az + d*rg**2 + e*rg+ f
-                funcbins = a*azbins**3 + b*azbins**2 + c*azbins + d*rgbins**2 + e*rgbins+ f
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,g*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),7))
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = (i - ibeg_emp)**3
-                    G[i*new_cols:(i+1)*new_cols,1] = (i - ibeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,2] =(i - ibeg_emp)
-                    G[i*new_cols:(i+1)*new_cols,3] = (np.arange((new_cols)) - jbeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,4] = np.arange((new_cols)) - jbeg_emp
-                G[:,5] = 1
-                G[:,6] = elevi
-
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-1)],pars[:nparam-1]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-1):],pars[(nparam-1):]).reshape(new_lines,new_cols)
-
-            if (ivar==0 and nfit==1):
-                G=np.zeros((len(data),8))
-                G[:,0] = az**3
-                G[:,1] = az**2
-                G[:,2] = az
-                G[:,3] = rg**2
-                G[:,4] = rg
-                G[:,5] = 1
-                G[:,6] = topo_clean
-                G[:,7] = topo_clean**2
-
-                # ramp inversion1
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]; g = pars[6]; h = pars[7]
-                print ('Remove ramp %f az**3 + %f az**2  + %f az + %f r**2 + %f r + %f + %f z + %f z**2 for date: %i'%(a,b,c,d,e,f,g,h,idates[l]))
-
-                # plot phase/elev
-                funct = a*az**3 + b*az**2 + c*az + d*rg**2 + e*rg+ f
-                funcbins = a*azbins**3 + b*azbins**2 + c*azbins + d*rgbins**2 + e*rgbins+ f
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,g*x+h*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),8))
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = (i - ibeg_emp)**3
-                    G[i*new_cols:(i+1)*new_cols,1] = (i - ibeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,2] =(i - ibeg_emp)
-                    G[i*new_cols:(i+1)*new_cols,3] = (np.arange((new_cols)) - jbeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,4] = np.arange((new_cols)) - jbeg_emp
-                G[:,5] = 1
-                G[:,6] = elevi
-                G[:,7] = elevi**2
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-2)],pars[:nparam-2]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-2):],pars[(nparam-2):]).reshape(new_lines,new_cols)
-
-
-            elif (ivar==1 and nfit==0):
-                G=np.zeros((len(data),8))
-                G[:,0] = az**3
-                G[:,1] = az**2
-                G[:,2] = az
-                G[:,3] = rg**2
-                G[:,4] = rg
-                G[:,5] = 1
-                G[:,6] = topo_clean
-                G[:,7] = topo_clean*az
-
-                # ramp inversion1
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]; g = pars[6]; h=pars[7]
-                print ('Remove ramp %f az**3 + %f az**2  + %f az + %f r**2 + %f r + %f + %f z + %f z*az for date: %i'%(a,b,c,d,e,f,g,h,idates[l]))
-
-                # plot phase/elev
-                funct = a*az**3 + b*az**2 + c*az + d*rg**2 + e*rg + f + h*topo_clean*az
-                funcbins = a*azbins**3 + b*azbins**2 + c*azbins + d*rgbins**2 + e*rgbins+ f + h*topobins*azbins
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,g*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),8))
-                G[:,5] = 1
-                G[:,6] = elevi
-                G[:,7] = elevi
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = (i - ibeg_emp)**3
-                    G[i*new_cols:(i+1)*new_cols,1] = (i - ibeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,2] =(i - ibeg_emp)
-                    G[i*new_cols:(i+1)*new_cols,3] = (np.arange((new_cols)) - jbeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,4] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,7] *= (i - ibeg_emp)
-
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-2)],pars[:nparam-2]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-2):],pars[(nparam-2):]).reshape(new_lines,new_cols)
-
-            elif (ivar==1 and nfit==1):
-                G=np.zeros((len(data),10))
-                G[:,0] = az**3
-                G[:,1] = az**2
-                G[:,2] = az
-                G[:,3] = rg**2
-                G[:,4] = rg
-                G[:,5] = 1
-                G[:,6] = topo_clean*az
-                G[:,7] = topo_clean
-                G[:,8] = topo_clean**2
-                G[:,9] = (topo_clean*az)**2
-
-                # ramp inversion1
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]; g = pars[6]; h=pars[7]; i=pars[8]; k=pars[9]
-                print ('Remove ramp %f az**3 + %f az**2  + %f az + %f r**2 + %f r + %f z*az + %f + %f z + %f z**2 + %f (z*az)**2 for date: %i'%(a,b,c,d,e,f,g,h,i,k,idates[l]))
-
-                # plot phase/elev
-                funct = a*az**3 + b*az**2 + c*az + d*rg**2 + e*rg + f + g*topo_clean*az + k*(topo_clean*az)**2
-                funcbins = a*azbins**3 + b*azbins**2 + c*azbins + d*rgbins**2 + e*rgbins+ f + g*topobins*azbins + k*(topobins*azbins)**2
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,h*x+i*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),10))
-                G[:,5] = 1
-                G[:,6] = elevi
-                G[:,7] = elevi
-                G[:,8] = elevi**2
-                G[:,9] = elevi**2
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = (i - ibeg_emp)**3
-                    G[i*new_cols:(i+1)*new_cols,1] = (i - ibeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,2] =(i - ibeg_emp)
-                    G[i*new_cols:(i+1)*new_cols,3] = (np.arange((new_cols)) - jbeg_emp)**2
-                    G[i*new_cols:(i+1)*new_cols,4] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,6] *= (i - ibeg_emp)
-                    G[i*new_cols:(i+1)*new_cols,9] *= (i - ibeg_emp)**2
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-3)],pars[:nparam-3]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-3):],pars[(nparam-3):]).reshape(new_lines,new_cols)
-
-      elif order==9:
-        if arguments["--topofile"] is None:
-            G=np.zeros((len(data),5))
-            G[:,0] = rg
-            G[:,1] = az
-            G[:,2] = (rg*az)**2
-            G[:,3] = rg*az
-            G[:,4] = 1
-
-            # ramp inversion
-            x0 = lst.lstsq(G,data)[0]
-            _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-            _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-            pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-            a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]
-            print ('Remove ramp %f r + %f az  + %f r*az**2 + %f r*az + %f for date: %i'%(a,b,c,d,e,idates[l]))
-
-            # build total G matrix
-            G=np.zeros((len(los),5))
-            for i in range(new_lines):
-                G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-                G[i*new_cols:(i+1)*new_cols,1] = i - ibeg_emp
-                G[i*new_cols:(i+1)*new_cols,2] = ((i-ibeg_emp) * (np.arange((new_cols))-jbeg_emp))**2
-                G[i*new_cols:(i+1)*new_cols,3] = (i-ibeg_emp) * (np.arange((new_cols))-jbeg_emp)
-            G[:,4] = 1
-
-            res = los - np.dot(G,pars)
-            #rms = np.sqrt(np.nanmean(res**2))
-            rms = np.nanstd(res)
-            logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-            ramp = np.dot(G,pars).reshape(new_lines,new_cols)
+      if len(columns) == 0:
+          flata = los.reshape(new_lines,new_cols) - ramp
+          rms = nanstd_dot(los)
+          logger.info('RMS dates %i: %f'%(idates[l], rms))
 
-        else:
-            if (ivar==0 and nfit==0):
-                G=np.zeros((len(data),6))
-                G[:,0] = rg
-                G[:,1] = az
-                G[:,2] = (rg*az)**2
-                G[:,3] = rg*az
-                G[:,4] = 1
-                G[:,5] = topo_clean
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]
-
-                print ('Remove ramp %f r + %f az  + %f (r*az)**2 + %f r*az + %f + %f z for date: %i'%(a,b,c,d,e,f,idates[l]))
-
-                # plot phase/elev
-                funcbins = a*rgbins+ b*azbins + c*(azbins*rgbins)**2 + d*azbins*rgbins+ e
-                funct = a*rg+ b*az + c*(az*rg)**2 + d*az*rg+ e
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,e*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),6))
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,1] = i - ibeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] = ((i-ibeg_emp) * (np.arange((new_cols))-jbeg_emp))**2
-                    G[i*new_cols:(i+1)*new_cols,3] = (i-ibeg_emp) * (np.arange((new_cols))-jbeg_emp)
-                G[:,4] = 1
-                G[:,5] = elevi
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-1)],pars[:nparam-1]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-1):],pars[(nparam-1):]).reshape(new_lines,new_cols)
-
-            if (ivar==0 and nfit==1):
-                G=np.zeros((len(data),7))
-                G[:,0] = rg
-                G[:,1] = az
-                G[:,2] = (rg*az)**2
-                G[:,3] = rg*az
-                G[:,4] = 1
-                G[:,5] = topo_clean
-                G[:,6] = topo_clean**2
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5]; g = pars[6]
-
-                print ('Remove ramp %f r + %f az  + %f (r*az)**2 + %f r*az + %f + %f z + %f z**2  for date: %i'%(a,b,c,d,e,f,g,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg+ b*az + c*(rg*az)**2 + d*rg*az+ e
-                funcbins = a*rgbins+ b*azbins + c*(azbins*rgbins)**2 + d*azbins*rgbins+ e
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,f*x+g*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),7))
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,1] = i - ibeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] = ((i-ibeg_emp) * (np.arange((new_cols))-jbeg_emp))**2
-                    G[i*new_cols:(i+1)*new_cols,3] = (i-ibeg_emp) * (np.arange((new_cols))-jbeg_emp)
-                G[:,4] = 1
-                G[:,5] = elevi
-                G[:,6] = elevi**2
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-2)],pars[:nparam-2]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-2):],pars[(nparam-2):]).reshape(new_lines,new_cols)
-
-            elif (ivar==1 and nfit==0):
-                G=np.zeros((len(data),7))
-                G[:,0] = rg
-                G[:,1] = az
-                G[:,2] = (rg*az)**2
-                G[:,3] = rg*az
-                G[:,4] = 1
-                G[:,5] = topo_clean
-                G[:,6] = topo_clean*az
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5] ; g = pars[6]
-
-                print ('Remove ramp %f r + %f az  + %f (r*az)**2 + %f r*az + %f + %f z + %f az*z for date: %i'%(a,b,c,d,e,f,g,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg+ b*az + c*(rg*az)**2 + d*rg*az+ e + g*topo_clean*az
-                funcbins = a*rgbins+ b*azbins + c*(azbins*rgbins)**2 + d*azbins*rgbins+ e + g*topobins*azbins
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,f*x,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),7))
-                G[:,4] = 1
-                G[:,5] = elevi
-                G[:,6] = elevi
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,1] = i - ibeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] = ((i-ibeg_emp) * (np.arange((new_cols))-jbeg_emp))**2
-                    G[i*new_cols:(i+1)*new_cols,3] = (i-ibeg_emp) * (np.arange((new_cols))-jbeg_emp)
-                    G[i*new_cols:(i+1)*new_cols,6] *= (i - ibeg_emp)
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-2)],pars[:nparam-2]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-2):],pars[(nparam-2):]).reshape(new_lines,new_cols)
-
-            elif (ivar==1 and nfit==1):
-                G=np.zeros((len(data),8))
-                G[:,0] = rg
-                G[:,1] = az
-                G[:,2] = (rg*az)**2
-                G[:,3] = rg*az
-                G[:,4] = 1
-                G[:,5] = topo_clean*az
-                G[:,6] = topo_clean
-                G[:,7] = topo_clean**2
-
-                # ramp inversion
-                x0 = lst.lstsq(G,data)[0]
-                _func = lambda x: np.sum(((np.dot(G,x)-data)/rms)**2)
-                _fprime = lambda x: 2*np.dot(G.T/rms, (np.dot(G,x)-data)/rms)
-                pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0,acc=1.e-9)[0]
-                a = pars[0]; b = pars[1]; c = pars[2]; d = pars[3]; e = pars[4]; f = pars[5] ; g = pars[6]; h=pars[7]
-
-                print ('Remove ramp %f r + %f az  + %f (r*az)**2 + %f r*az + %f + %f az*z + %f z + %f z**2  for date: %i'%(a,b,c,d,e,f,g,h,idates[l]))
-
-                # plot phase/elev
-                funct = a*rg+ b*az + c*(rg*az)**2 + d*rg*az+ e + f*topo_clean*az
-                funcbins = a*rgbins+ b*azbins + c*(azbins*rgbins)**2 + d*azbins*rgbins+ e + f*topobins*azbins
-                x = np.linspace(mintopo, maxtopo, 100)
-                ax_dphi.scatter(topo_clean,los_clean-funct, s=0.01, alpha=0.3, rasterized=True)
-                ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
-                ax_dphi.plot(x,g*x+h*x**2,'-r', lw =4.)
-
-                # build total G matrix
-                G=np.zeros((len(los),8))
-                G[:,4] = 1
-                G[:,5] = elevi
-                G[:,6] = elevi
-                G[:,7] = elevi**2
-                for i in range(new_lines):
-                    G[i*new_cols:(i+1)*new_cols,0] = np.arange((new_cols)) - jbeg_emp
-                    G[i*new_cols:(i+1)*new_cols,1] = i - ibeg_emp
-                    G[i*new_cols:(i+1)*new_cols,2] = ((i-ibeg_emp) * (np.arange((new_cols))-jbeg_emp))**2
-                    G[i*new_cols:(i+1)*new_cols,3] = (i-ibeg_emp) * (np.arange((new_cols))-jbeg_emp)
-                    G[i*new_cols:(i+1)*new_cols,5] *= (i - ibeg_emp)
-
-                res = los - np.dot(G,pars)
-                #rms = np.sqrt(np.nanmean(res**2))
-                rms = np.nanstd(res)
-                logger.info('RMS dates %i: %f'%(idates[l], rms))
-
-                nparam = G.shape[1]
-                ramp = np.dot(G[:,:(nparam-3)],pars[:nparam-3]).reshape(new_lines,new_cols)
-                topo = np.dot(G[:,(nparam-3):],pars[(nparam-3):]).reshape(new_lines,new_cols)
-
-      # flata = (los - np.dot(G,pars)).reshape(new_lines,new_cols)
-      flata = los.reshape(new_lines,new_cols) - ramp - topo
+      else:
+          if arguments["--topofile"] is not None and order == 0 and ivar == 0:
+              # fit the sliding median
+              rfit, azfit, zfit = rgbins, azbins, topobins
+          else:
+              rfit, azfit, zfit = rg, az, topo_clean
+
+          # ramp inversion: unbounded, so weighted least-square
+          # few columns and many points: solve the normal equations with
+          # unit-norm columns, SVD only if they are ill-conditioned
+          GtG, Gtd = normal_equations(columns,rfit,azfit,zfit,data,rms)
+          norm = np.sqrt(np.diag(GtG))
+          norm[norm==0] = 1.
+          try:
+              with warnings.catch_warnings():
+                  warnings.simplefilter('error',lst.LinAlgWarning)
+                  pars = lst.solve(GtG/np.outer(norm,norm),Gtd/norm,assume_a='pos')/norm
+          except (lst.LinAlgError,lst.LinAlgWarning):
+              Gw = build_columns(columns,rfit,azfit,zfit)/np.reshape(rms,(-1,1))/norm
+              pars = lst.lstsq(Gw,data/rms,lapack_driver='gelsd')[0]/norm
+              del Gw
+          logger.info('Remove %s %s for date: %i'%('ref frame' if order==0 else 'ramp', \
+              ' + '.join('%f %s'%(p,c) for p,c in zip(pars,columns)), idates[l]))
+
+          # ramp terms, or all terms for a reference frame
+          if order == 0:
+              itopo = np.arange(len(columns))
+          else:
+              itopo = np.array([i for i in range(len(columns)) if columns[i] in topo_columns],dtype=int)
+          iramp = np.setdiff1d(np.arange(len(columns)),itopo)
+
+          # plot phase/elev
+          if ax_dphi is not None:
+              # everything but the pure elevation terms
+              iplot = np.array([i for i in range(len(columns)) if columns[i] not in ('z','z**2')],dtype=int)
+              ielev = np.setdiff1d(np.arange(len(columns)),iplot)
+              funct = eval_columns([columns[i] for i in iplot],pars[iplot],rg,az,topo_clean)
+              funcbins = eval_columns([columns[i] for i in iplot],pars[iplot],rgbins,azbins,topobins)
+              x = np.linspace(mintopo, maxtopo, 100)
+              # point density rather than millions of markers
+              ax_dphi.hexbin(topo_clean,los_clean-funct, gridsize=200, bins='log', mincnt=1, cmap='Greys', rasterized=True)
+              ax_dphi.plot(topobins,losbins - funcbins,'-r', lw =1., label='sliding median')
+              ax_dphi.plot(x,eval_columns([columns[i] for i in ielev],pars[ielev],x,x,x),'-r', lw =4.)
+
+          # evaluate the model on the full grid
+          ramp = eval_grid([columns[i] for i in iramp],pars[iramp])
+          topo = eval_grid([columns[i] for i in itopo],pars[itopo])
+
+          # residuals are the flatten map
+          flata = los.reshape(new_lines,new_cols) - ramp
+          flata -= topo
+          rms = nanstd_dot(flata)
+          logger.info('RMS dates %i: %f'%(idates[l], rms))
 
       return ramp, flata, topo, rms
  
@@ -3220,8 +1331,6 @@ def empirical_cor(l):
   Function that preapare and run empirical estimaton for each interferogram kk
   """
 
-  global fig_dphi
-
   # first clean los
   maps_temp = np.matrix.copy(maps[:,:,l]) - np.matrix.copy(models[:,:,l])
 
@@ -3231,40 +1340,28 @@ def empirical_cor(l):
     maxlos,minlos=np.nanpercentile(maps_temp[ibeg_emp:iend_emp,jbeg_emp:jend_emp],float(arguments["--perc_los"])),np.nanpercentile(maps_temp[ibeg_emp:iend_emp,jbeg_emp:jend_emp],100-float(arguments["--perc_los"]))
     logger.debug('Set Max-Min LOS for empirical estimation: {0}-{1}'.format(maxlos,minlos))
     kk = np.nonzero(np.logical_or(maps_temp==0.,np.logical_or((maps_temp>maxlos),(maps_temp<minlos))))
-    maps_temp[kk] = np.float('NaN')
+    maps_temp[kk] = np.nan
 
+    # first lines fully empty: a block is empty if all its values are NaN
     itemp = ibeg_emp
     for lign in range(ibeg_emp,iend_emp,10):
-        if np.isnan(np.nanmean(maps[lign:lign+10,:,l])):
+        if np.isnan(maps[lign:lign+10,:,l]).all():
             itemp = lign
         else:
             break
     logger.debug('Begining of the image: {}'.format(itemp))
 
-    if arguments["--topofile"] is not None:
-        ax_dphi = fig_dphi.add_subplot(4,int(N/4)+1,l+1)
+    # phase/topo plot recorded here, drawn by the caller
+    if plot=='yes' and arguments["--topofile"] is not None:
+        ax_dphi = axes_record()
     else:
         ax_dphi = None
 
     logger.debug('Threshold RMS: {}'.format(float(arguments["--threshold_rms"])))
 
     # selection pixels
-    index = np.nonzero(np.logical_and(elev<maxtopo,
-        np.logical_and(elev>mintopo,
-            np.logical_and(mask_flat>np.float(arguments["--threshold_mask"]),
-            np.logical_and(~np.isnan(maps_temp),
-                np.logical_and(~np.isnan(rmsmap),
-                np.logical_and(~np.isnan(elev),
-                np.logical_and(rmsmap<float(arguments["--threshold_rms"]),
-                np.logical_and(rmsmap>1.e-6,
-                np.logical_and(~np.isnan(maps_temp),
-                np.logical_and(pix_az>ibeg_emp,
-                np.logical_and(pix_az<iend_emp,
-                np.logical_and(pix_rg>jbeg_emp,
-                np.logical_and(pix_rg<jend_emp, 
-                    slope>0.,
-                    ))))))))
-                ))))))
+    select = select_emp & ~np.isnan(maps_temp)
+    index = np.nonzero(select)
 
     # print (elev[:5],maxtopo, mintopo)
     # print (ibeg,iend,jbeg,jend)
@@ -3282,7 +1379,7 @@ def empirical_cor(l):
     if len(los_clean) < 1:
       logger.critical('No points left for empirical estimation. Exit!')
       logger.critical('threshold RMS: {0}, threshold Mask: {1}, Min-Max LOS: {2}-{3}, Min-Max topo: {4}-{5}, lines: {6}-{7}, \
-        cols: {8}- {9}'.format(float(arguments["--threshold_rms"]),np.float(arguments["--threshold_mask"]),minlos,maxlos,mintopo,maxtopo,ibeg_emp,iend_emp,jbeg_emp,jend_emp))
+        cols: {8}- {9}'.format(float(arguments["--threshold_rms"]),float(arguments["--threshold_mask"]),minlos,maxlos,mintopo,maxtopo,ibeg_emp,iend_emp,jbeg_emp,jend_emp))
       sys.exit()
 
     # print itemp, iend_emp
@@ -3301,7 +1398,7 @@ def empirical_cor(l):
       nfit_temp=nfit
 
     # call ramp estim
-    los = as_strided(maps[:,:,l]).flatten()
+    los = maps[:,:,l].flatten()
     samp = 1
 
     map_ramp, map_flata, map_topo, rmsi = estim_ramp(los,los_clean[::samp],topo_clean[::samp],x[::samp],\
@@ -3309,25 +1406,11 @@ def empirical_cor(l):
 
     if (lin_start is not None) and (lin_end is not None):
       # try:
-        indexref = np.nonzero(np.logical_and(elev<maxtopo,
-        np.logical_and(elev>mintopo,
-            np.logical_and(mask_flat>np.float(arguments["--threshold_mask"]),
-            np.logical_and(~np.isnan(maps_temp),
-                np.logical_and(~np.isnan(rmsmap),
-                np.logical_and(~np.isnan(elev),
-                np.logical_and(rmsmap<float(arguments["--threshold_rms"]),
-                np.logical_and(rmsmap>1.e-6,
-                np.logical_and(~np.isnan(maps_temp),
-                np.logical_and(pix_az>lin_start,
-                np.logical_and(pix_az<lin_end,
-                np.logical_and(pix_rg>col_start,
-                np.logical_and(pix_rg<col_end, 
-                    slope>0.,
-                ))))))))))))
-                ))
+        select = select_ref & ~np.isnan(maps_temp)
+        indexref = np.nonzero(select)
         
         ## Set data to zero in the ref area
-        zone = as_strided(map_flata[:,:])
+        zone = map_flata[:,:]
         los_ref2 = zone[indexref].flatten()
         rms_ref = rmsmap[indexref].flatten()
         amp_ref = 1./rms_ref
@@ -3347,26 +1430,54 @@ def empirical_cor(l):
     map_flata = np.copy(maps[:,:,l])
     map_ramp, map_topo  = np.zeros(np.shape(map_flata)), np.zeros(np.shape(map_flata))
     rmsi = 1
+    ax_dphi = None
 
+  # write in the shared cubes: only rms and the plot go back to the caller
   # set ramp to NaN to have ramp of the size of the images
-  kk = np.nonzero(np.isnan(map_flata))
-  ramp = as_strided(map_ramp)
-  ramp[kk] = float('NaN')
-  topo = as_strided(map_topo)
-  topo[kk] = float('NaN')
+  map_ramp = map_ramp + map_topo
+  map_ramp[np.isnan(map_flata)] = np.nan
+  maps_ramp[:,:,l] = map_ramp
+  maps_flata[:,:,l] = map_flata
   
-  return map_ramp, map_flata, map_topo, rmsi 
+  return rmsi, ax_dphi
+
+# per set of valid dates: design matrix, diag([G.TG]-1) and the pseudo-inverse
+# of G (--ineq=no), or of G without postseismic for the prior solution of
+# consInvert (bounded to a few thousands sets)
+pattern_cache = {}
+def pattern_terms(k):
+    key = k.tobytes()
+    if key not in pattern_cache:
+        if len(pattern_cache) > 5000:
+            pattern_cache.clear()
+        # select the valid dates in the temporal design matrix
+        G = G_full[k,:]
+        try:
+            diagvarx = np.diag(np.linalg.inv(np.dot(G.T,G)))
+        except:
+            diagvarx = np.full((M),np.nan)
+        pinv = None
+        try:
+            if arguments["--ineq"]=='no':
+                # products with the float32 data in float32
+                pinv = pinvSVD(G,arguments["--cond"]).astype(np.float32)
+            elif len(indexpo)>0:
+                pinv = pinvSVD(G[:,indexnopo],arguments["--cond"])
+        except:
+            pass
+        pattern_cache[key] = G, diagvarx, pinv
+    return pattern_cache[key]
 
 def temporal_decomp(pix):
     j = pix  % (new_cols)
     i = int(pix/(new_cols))
 
     # Initialisation
-    mdisp=np.ones((N))*float('NaN')
-    mlin=np.ones((N))*float('NaN')
-    mseas=np.ones((N))*float('NaN')
-    mvect=np.ones((N))*float('NaN')
-    disp = as_strided(maps_flata[i,j,:])
+    mdisp=np.full((N),np.nan)
+    mlin=np.full((N),np.nan)
+    mseas=np.full((N),np.nan)
+    mvect=np.full((N),np.nan)
+    disp = maps_flata[i,j,:]
     k = np.flatnonzero(~np.isnan(disp)) # invers of isnan
     # do not take into account NaN data
     kk = len(k)
@@ -3378,27 +1489,15 @@ def temporal_decomp(pix):
     aps_tmp = np.zeros((N))
 
     # Inisilize m to zero
-    m = np.ones((M))*float('NaN')
-    sigmam = np.ones((M))*float('NaN')
+    m = np.full((M),np.nan)
+    sigmam = np.full((M),np.nan)
 
     if kk > N/6:
-        G=np.zeros((kk,M))
-        # Build G family of function k1(t),k2(t),...,kn(t): #
-        #                                                   #
-        #           |k1(0) .. kM(0)|                        #
-        # Gfamily = |k1(1) .. kM(1)|                        #
-        #           |..    ..  ..  |                        #
-        #           |k1(N) .. kM(N)|                        #
-        #                                                   #
-
-        G=np.zeros((kk,M))
-        for l in range((Mbasis)):
-            G[:,l]=basis[l].g(tabx)
-        for l in range((Mker)):
-            G[:,Mbasis+l]=kernels[l].g(k)
+        # quantities that only depend on the valid dates
+        G, diagvarx, pinvpo = pattern_terms(k)
 
         # inversion
-        m,sigmam = consInvert(G,taby,inaps[k],cond=arguments["--cond"],ineq=arguments["--ineq"])
+        m,sigmam = consInvert(G,taby,inaps[k],cond=arguments["--cond"],ineq=arguments["--ineq"],diagvarx=diagvarx,pinvpo=pinvpo)
 
         # forward model in original order
         mdisp[k] = np.dot(G,m)
@@ -3423,16 +1522,116 @@ def temporal_decomp(pix):
       return m, sigmam, mdisp, aps_tmp, naps_tmp
     
 
-# initialization
-maps_flata = np.copy(maps)
-models = np.zeros((new_lines,new_cols,N))
+def temporal_decomp_block(work):
+    '''Unconstrained time decomposition of the pixels in work (a block of lines):
+    pixels with the same valid dates share the same G and are inverted together'''
+    pix = np.asarray(work)
+    ipix, jpix = pix//new_cols, pix%new_cols
+    disp = maps_flata[ipix,jpix,:]
+    valid = ~np.isnan(disp)
 
-# prepare flatten maps
-maps_ramp = np.zeros((new_lines,new_cols,N))
-maps_topo = np.zeros((new_lines,new_cols,N))
+    # Initialisation
+    mdisp_block = np.full((len(pix),N),np.nan,dtype=np.float32)
+    mseas_block, mvect_block = None, None
+    if arguments["--fulloutput"]=='yes':
+        mseas_block = np.full((len(pix),N),np.nan,dtype=np.float32)
+        mvect_block = np.full((len(pix),N),np.nan,dtype=np.float32)
+    m_block = np.full((M,len(pix)),np.nan,dtype=np.float32)
+    sigmam_block = np.full((M,len(pix)),np.nan,dtype=np.float32)
+    aps_tmp = np.zeros((N))
+    naps_tmp = np.zeros((N),dtype=int)
+
+    # group the pixels by set of valid dates: sort once
+    patterns, inverse = np.unique(np.packbits(valid,axis=1), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.searchsorted(inverse[order], np.arange(len(patterns)+1))
+    for p in range(len(patterns)):
+        index = order[bounds[p]:bounds[p+1]]
+        k = np.flatnonzero(valid[index[0]])
+        kk = len(k)
+        if kk <= N/6:
+            continue
+        G, diagvarx, pinv = pattern_terms(k)
+
+        # inversion of all pixels at once: one column per pixel
+        taby = disp[index][:,k].T
+        if pinv is not None:
+            m = np.dot(pinv,taby)
+        else:
+            m = lst.lstsq(G,taby,lapack_driver='gelsy')[0]
+        mdisp = np.dot(G.astype(m.dtype),m)
+        # residuals of all pixels of the group in one pass
+        resid = taby - mdisp
+
+        try:
+           res2 = np.einsum('ij,ij->j',resid,resid)
+           scale = 1./(G.shape[0]-G.shape[1])
+           sigmam = np.sqrt(scale*np.outer(diagvarx,res2))
+        except:
+           sigmam = np.full((M,len(index)),np.nan)
+
+        mdisp_block[index[:,np.newaxis],k] = mdisp.T
+        aps_tmp[k] = aps_tmp[k] + np.sum(abs(resid),axis=1)
+        naps_tmp[k] = naps_tmp[k] + len(index)
+
+        if arguments["--fulloutput"]=='yes':
+          if arguments["--seasonal"] =='yes':
+              mseas_block[index[:,np.newaxis],k] = np.dot(G[:,indexseas:indexseas+2],m[indexseas:indexseas+2]).T
+          if arguments["--vector"] != None:
+              mvect_block[index[:,np.newaxis],k] = np.dot(G[:,indexvect],m[indexvect]).T
+
+        m_block[:,index] = m
+        sigmam_block[:,index] = sigmam
+
+    return m_block, sigmam_block, mdisp_block, mseas_block, mvect_block, aps_tmp, naps_tmp
+
+# Build G family of function k1(t),k2(t),...,kn(t): #
+#                                                   #
+#           |k1(0) .. kM(0)|                        #
+# Gfamily = |k1(1) .. kM(1)|                        #
+#           |..    ..  ..  |                        #
+#           |k1(N) .. kM(N)|                        #
+#                                                   #
+# same for all pixels: computed once for all dates
+G_full=np.zeros((N,M))
+for l in range((Mbasis)):
+    G_full[:,l]=basis[l].g(dates)
+for l in range((Mker)):
+    G_full[:,Mbasis+l]=kernels[l].g(np.arange(N))
+
+# full grid coordinates for the empirical models
+az_full = np.repeat(np.arange(new_lines) - ibeg_emp, new_cols)
+rg_full = np.tile(np.arange(new_cols) - jbeg_emp, new_lines)
+
+# pixels selected for the empirical estimations, in the estimation window
+# and in the ref zone: the same for all dates, empirical_cor only removes
+# the NaN of each date
+pix_az, pix_rg = np.indices((new_lines,new_cols))
+select_emp = (elev<maxtopo) & (elev>mintopo) \
+    & ~np.isnan(rmsmap) & ~np.isnan(elev) \
+    & (rmsmap<float(arguments["--threshold_rms"])) & (rmsmap>1.e-6) \
+    & (slope>0.)
+if mask_flat is not None:
+    select_emp &= mask_flat>float(arguments["--threshold_mask"])
+if (lin_start is not None) and (lin_end is not None):
+    select_ref = select_emp & (pix_az>lin_start) & (pix_az<lin_end) & (pix_rg>col_start) & (pix_rg<col_end)
+select_emp &= (pix_az>ibeg_emp) & (pix_az<iend_emp) & (pix_rg>jbeg_emp) & (pix_rg<jend_emp)
+del pix_az, pix_rg
+
+# initialization: cubes in float32, as the input and output cubes
+# maps_flata and maps_ramp are filled by the empirical_cor workers,
+# maps_flata is mapped on the output flatten cube
+maps_flata = shared_zeros(maps.shape,np.float32,filename='depl_cumule_flat')
+maps_flata[:] = maps
+models = np.zeros((new_lines,new_cols,N),dtype=np.float32)
+
+# prepare flatten maps: ramp and topo corrections are only used summed,
+# keep a single cube
+maps_ramp = shared_zeros((new_lines,new_cols,N))
 rms = np.zeros((N))
 
-for ii in range(np.int(arguments["--niter"])):
+for ii in range(int(arguments["--niter"])):
     print()
     print('---------------')
     print('iteration: {}'.format(ii+1))
@@ -3442,9 +1641,8 @@ for ii in range(np.int(arguments["--niter"])):
     # SPATIAL ITERATION N  ######
     #############################
 
-    pix_az, pix_rg = np.indices((new_lines,new_cols))
     # if radar file just initialise figure
-    if arguments["--topofile"] is not None:
+    if plot=='yes' and arguments["--topofile"] is not None:
       nfigure +=1
       fig_dphi = plt.figure(nfigure,figsize=(14,10))
     
@@ -3459,48 +1657,49 @@ for ii in range(np.int(arguments["--niter"])):
       #########################################
       print()
     
-      for l in range((N)):
-          maps_ramp[:,:,l], maps_flata[:,:,l], maps_topo[:,:,l], rms[l] = empirical_cor(l)
-
-      # output = []
-      # with TimeIt():
-      #     work = range(N)
-      #     with poolcontext(processes=nproc) as pool:
-      #         results = pool.map(empirical_cor, work)
-      #         # maps_ramp[:,:,l], maps_flata[:,:,l], maps_topo[:,:,l], rms[l] = results[0][l]
-      #         # TypeError: cannot unpack non-iterable int object
-      #     output.append(results)
-
-      #     # fetch results
-      #     for l in range(N):
-      #         maps_ramp[:,:,l], maps_flata[:,:,l], maps_topo[:,:,l], rms[l] = output[0][l]
-      #     del output
-
-      # plot corrected ts
-      nfigure +=1
-      figd = plt.figure(nfigure,figsize=(14,10))
-      figd.subplots_adjust(hspace=0.001,wspace=0.001)
-      for l in range((N)):
-          axd = figd.add_subplot(4,int(N/4)+1,l+1)
-          caxd = axd.imshow(maps_flata[:,:,l],cmap=cmap,vmax=vmax,vmin=vmin)
-          axd.set_title(idates[l],fontsize=6)
+      def store_empcor(l, output):
+          rms[l], ax_rec = output
+          if ax_rec is not None:
+              ax_rec.replay(fig_dphi.add_subplot(4,int(N/4)+1,l+1))
+
+      # dates are independent
+      with TimeIt():
+          if nproc > 1:
+              with poolcontext(processes=nproc,initializer=init_worker) as pool:
+                  for l, output in enumerate(pool.imap(empirical_cor, range(N))):
+                      store_empcor(l, output)
+          else:
+              for l in range((N)):
+                  store_empcor(l, empirical_cor(l))
+
+      if plot=='yes':
+          # plot corrected ts
+          nfigure +=1
+          figd = plt.figure(nfigure,figsize=(14,10))
+          figd.subplots_adjust(hspace=0.001,wspace=0.001)
+          for l in range((N)):
+              axd = figd.add_subplot(4,int(N/4)+1,l+1)
+              caxd = axd.imshow(maps_flata[:,:,l],cmap=cmap,norm=tsnorm,interpolation='nearest')
+              axd.set_title(idates[l],fontsize=6)
+              plt.setp(axd.get_xticklabels(), visible=False)
+              plt.setp(axd.get_yticklabels(), visible=False)
           plt.setp(axd.get_xticklabels(), visible=False)
           plt.setp(axd.get_yticklabels(), visible=False)
-      plt.setp(axd.get_xticklabels(), visible=False)
-      plt.setp(axd.get_yticklabels(), visible=False)
-      figd.colorbar(caxd, orientation='vertical',aspect=10)
-      figd.suptitle('Corrected time series maps')
-      # fig.tight_layout()
-      figd.savefig('maps_flat.eps', format='EPS',dpi=150)
-
-      if arguments["--topofile"] is not None:
-          fig.savefig('phase-topo.eps', format='EPS',dpi=150)
+          figd.colorbar(caxd, orientation='vertical',aspect=10)
+          figd.suptitle('Corrected time series maps')
+          # fig.tight_layout()
+          figd.savefig('maps_flat.eps', format='EPS',dpi=150)
+
+      if plot=='yes' and arguments["--topofile"] is not None:
+          fig_dphi.savefig('phase-topo.eps', format='EPS',dpi=150)
+
+      if plot=='yes' and arguments["--topofile"] is not None:
           nfigure +=1
           figtopo = plt.figure(nfigure,figsize=(14,10))
           figtopo.subplots_adjust(hspace=.001,wspace=0.001)
           for l in range((N)):
               axtopo = figtopo.add_subplot(4,int(N/4)+1,l+1)
-              caxtopo = axtopo.imshow(maps_topo[:,:,l]+maps_ramp[:,:,l],cmap=cmap,vmax=vmax,vmin=vmin)
+              caxtopo = axtopo.imshow(maps_ramp[:,:,l],cmap=cmap,norm=tsnorm,interpolation='nearest')
               axtopo.set_title(idates[l],fontsize=6)
               plt.setp(axtopo.get_xticklabels(), visible=False)
               plt.setp(axtopo.get_yticklabels(), visible=False)
@@ -3511,14 +1710,14 @@ for ii in range(np.int(arguments["--niter"])):
           # fig.tight_layout()
           figtopo.savefig('tropo.eps', format='EPS',dpi=150)
           
-      else:
+      elif plot=='yes':
           # plot corrected ts
           nfigure +=1
           figref = plt.figure(nfigure,figsize=(14,10))
           figref.subplots_adjust(hspace=0.001,wspace=0.001)
           for l in range((N)):
               axref = figref.add_subplot(4,int(N/4)+1,l+1)
-              caxref = axref.imshow(maps_ramp[:,:,l],cmap=cmap,vmax=vmax,vmin=vmin)
+              caxref = axref.imshow(maps_ramp[:,:,l],cmap=cmap,norm=tsnorm,interpolation='nearest')
               axref.set_title(idates[l],fontsize=6)
               plt.setp(axref.get_xticklabels(), visible=False)
               plt.setp(axref.get_yticklabels(), visible=False)
@@ -3542,9 +1741,7 @@ for ii in range(np.int(arguments["--niter"])):
         # scale between 0 and 1 
         maxaps = np.nanmax(inaps)
         inaps = inaps/maxaps
-        minaps= np.nanpercentile(inaps,2)
-        index = np.flatnonzero(inaps<minaps)
-        inaps[index] = minaps
+        np.clip(inaps,np.nanpercentile(inaps,2),None,out=inaps)
         np.savetxt('rms_empcor.txt', inaps.T)
         del rms
 
@@ -3566,50 +1763,84 @@ for ii in range(np.int(arguments["--niter"])):
     logger.debug('Input uncertainties: {}'.format(inaps))
 
     # reiinitialize maps models
-    models = np.zeros((new_lines,new_cols,N))
+    models = np.zeros((new_lines,new_cols,N),dtype=np.float32)
     if arguments["--fulloutput"]=='yes':
-      models_seas = np.zeros((new_lines,new_cols,N))
-      models_vect = np.zeros((new_lines,new_cols,N))
+      models_seas = np.zeros((new_lines,new_cols,N),dtype=np.float32)
+      models_vect = np.zeros((new_lines,new_cols,N),dtype=np.float32)
 
-    with TimeIt():
-          for pix in range(0,(new_lines)*(new_cols),int(arguments["--sampling"])):
-              j = pix  % (new_cols)
-              i = int(pix/(new_cols))
-
-              if ((i % 50) == 0) and (j==0):
-                logger.info('Processing line: {}'.format(i))
-              
-              if arguments["--fulloutput"]=='yes':
-                m, sigmam, models[i,j,:], models_seas[i,j,:], models_vect[i,j,:], aps_pix, naps_pix = temporal_decomp(pix)
-              else:
-                m, sigmam, models[i,j,:], aps_pix, naps_pix = temporal_decomp(pix)
-            
-              aps = aps + aps_pix
-              n_aps = n_aps + naps_pix
+    def store_decomp(pix, output):
+        global aps, n_aps
+        j = pix  % (new_cols)
+        i = int(pix/(new_cols))
+
+        if ((i % 50) == 0) and (j==0):
+          logger.info('Processing line: {}'.format(i))
+
+        if arguments["--fulloutput"]=='yes':
+          m, sigmam, models[i,j,:], models_seas[i,j,:], models_vect[i,j,:], aps_pix, naps_pix = output
+        else:
+          m, sigmam, models[i,j,:], aps_pix, naps_pix = output
+
+        aps = aps + aps_pix
+        n_aps = n_aps + naps_pix
+
+        # save m
+        m_maps[:,i,j] = m
+        sigmam_maps[:,i,j] = sigmam
 
-              # save m
-              for l in range((Mbasis)):
-                  basis[l].m[i,j] = m[l]
-                  basis[l].sigmam[i,j] = sigmam[l]
+    def store_decomp_block(work, output):
+        global aps, n_aps
+        pix = np.asarray(work)
+        i, j = pix//new_cols, pix%new_cols
+        logger.info('Processing lines: {}-{}'.format(i[0],i[-1]))
 
-              for l in range((Mker)):
-                  kernels[l].m[i,j] = m[Mbasis+l]
-                  kernels[l].sigmam[i,j] = sigmam[Mbasis+l]
+        m, sigmam, models[i,j,:], mseas, mvect, aps_block, naps_block = output
+        if arguments["--fulloutput"]=='yes':
+          models_seas[i,j,:], models_vect[i,j,:] = mseas, mvect
+
+        aps = aps + aps_block
+        n_aps = n_aps + naps_block
 
-              del m, sigmam
+        # save m
+        m_maps[:,i,j] = m
+        sigmam_maps[:,i,j] = sigmam
+
+    with TimeIt():
+          work = range(0,(new_lines)*(new_cols),int(arguments["--sampling"]))
+          if arguments["--ineq"]=='no':
+              logger.info('Invert pixels sharing the same valid dates together')
+              # blocks of lines of about 4e6 values, the pseudo-inverses
+              # are kept from one block to the other in pattern_cache
+              blocklines = max(1,4000000//(new_cols*N))
+              nblock = max(1,blocklines*new_cols//int(arguments["--sampling"]))
+              blocks = [work[b:b+nblock] for b in range(0,len(work),nblock)]
+              if nproc > 1:
+                  with poolcontext(processes=nproc,initializer=init_worker) as pool:
+                      for block, output in zip(blocks, pool.imap(temporal_decomp_block, blocks)):
+                          store_decomp_block(block, output)
+              else:
+                  for block in blocks:
+                      store_decomp_block(block, temporal_decomp_block(block))
+          elif nproc > 1:
+              # workers are forked with the current maps and uncertainties,
+              # send pixels by chunks of lines to limit the communications
+              with poolcontext(processes=nproc,initializer=init_worker) as pool:
+                  for pix, output in zip(work, pool.imap(temporal_decomp, work, chunksize=new_cols)):
+                      store_decomp(pix, output)
+          else:
+              for pix in work:
+                  store_decomp(pix, temporal_decomp(pix))
 
     # convert aps in rad
     aps = aps/n_aps
     # aps = np.sqrt(abs(aps/n_aps))
 
     # remove low aps to avoid over-fitting in next iter
-    minaps= np.nanpercentile(aps,2)
-    index = np.flatnonzero(aps<minaps)
-    aps[index] = minaps
+    np.clip(aps,np.nanpercentile(aps,2),None,out=aps)
 
     print('Dates      APS     # of points')
     for l in range(N):
-        print (idates[l], aps[l], np.int(n_aps[l]))
+        print (idates[l], aps[l], int(n_aps[l]))
     np.savetxt('aps_{}.txt'.format(ii), aps.T, fmt=('%.6f'))
     # set apsf is yes for iteration
     apsf=='yes'
@@ -3622,21 +1853,23 @@ for ii in range(np.int(arguments["--niter"])):
 
 # create new cube
 logger.info('Save flatten time series cube: {}'.format('depl_cumule_flat'))
-fid = open('depl_cumule_flat', 'wb')
-maps_flata[:,:,:].flatten().astype('float32').tofile(fid)
-fid.close()
+maps_flata.flush()
 
 if arguments["--fulloutput"]=='yes':
     if (arguments["--seasonal"] =='yes'):
         logger.info('Save time series cube without seasonality: {}'.format('depl_cumule_dseas'))
         fid = open('depl_cumule_dseas', 'wb')
-        (maps_flata - models_seas).flatten().astype('float32').tofile(fid)
+        # line by line: no full cube temporary
+        for i in range(new_lines):
+            (maps_flata[i] - models_seas[i]).astype('float32').tofile(fid)
         fid.close()
 
     if arguments["--vector"] != None:
         fid = open('depl_cumule_dvect', 'wb')
         logger.info('Save time series cube without vector component: {}'.format('depl_cumule_dvect'))
-        (maps_flata - models_vect).flatten().astype('float32').tofile(fid)
+        # line by line: no full cube temporary
+        for i in range(new_lines):
+            (maps_flata[i] - models_vect[i]).astype('float32').tofile(fid)
         fid.close()
 
     del models_vect, models_seas
@@ -3648,95 +1881,102 @@ if arguments["--fulloutput"]=='yes':
     if not os.path.exists(outdir):
         os.makedirs(outdir)
 
-# plot displacements models and residuals
-nfigure +=1
-figres = plt.figure(nfigure,figsize=(14,10))
-figres.subplots_adjust(hspace=.001,wspace=0.001)
-
-nfigure +=1
-fig = plt.figure(nfigure,figsize=(14,10))
-fig.subplots_adjust(hspace=.001,wspace=0.01)
-
-# nfigure +=1
-# figall = plt.figure(nfigure,figsize=(20,9))
-# figall.subplots_adjust(hspace=0.00001,wspace=0.001)
-
-nfigure +=1
-figclr = plt.figure(nfigure)
-# plot color map
-ax = figclr.add_subplot(1,1,1)
-cax = ax.imshow(maps[:,:,-1],cmap=cmap,vmax=vmax,vmin=vmin)
-plt.setp( ax.get_xticklabels(), visible=False)
-cbar = figclr.colorbar(cax, orientation='horizontal',aspect=5)
-figclr.savefig('colorscale.eps', format='EPS',dpi=150)
-
-for l in range((N)):
-    data = as_strided(maps[:,:,l])
-    if Mker>0:
-        data_flat = as_strided(maps_flata[:,:,l])- as_strided(kernels[0].m[:,:]) - as_strided(basis[0].m[:,:])
-        model = as_strided(models[:,:,l]) - as_strided(basis[0].m[:,:]) - as_strided(kernels[0].m[:,:])
-    else:
-        data_flat = as_strided(maps_flata[:,:,l]) - as_strided(basis[0].m[:,:])
-        model = as_strided(models[:,:,l]) - as_strided(basis[0].m[:,:])
-
-    res = data_flat - model
-    ramp = as_strided(maps_ramp[:,:,l])
-    tropo = as_strided(maps_topo[:,:,l])
-
-    ax = fig.add_subplot(4,int(N/4)+1,l+1)
-    axres = figres.add_subplot(4,int(N/4)+1,l+1)
-
-    # axall = figall.add_subplot(6,N,l+1)
-    # axall.imshow(data,cmap=cmap,vmax=vmax,vmin=vmin)
-    # axall.set_title(idates[l],fontsize=6)
-    # plt.setp(axall.get_xticklabels(), visible=False)
-    # plt.setp(axall.get_yticklabels(), visible=False)
-    # if l==0:
-    #     axall.set_ylabel('DATA')
-    # axall = figall.add_subplot(6,N,l+1+N)
-    # axall.imshow(ramp,cmap=cmap,vmax=vmax,vmin=vmin)
-    # plt.setp(axall.get_xticklabels(), visible=False)
-    # plt.setp(axall.get_yticklabels(), visible=False)
-    # if l==0:
-    #     axall.set_ylabel('RAMP')
-    # axall = figall.add_subplot(6,N,l+1+2*N)
-    # axall.imshow(tropo,cmap=cmap,vmax=vmax,vmin=vmin)
-    # plt.setp(axall.get_xticklabels(), visible=False)
-    # plt.setp(axall.get_yticklabels(), visible=False)
-    # if l==0:
-    #     axall.set_ylabel('TROP0')
-    # axall = figall.add_subplot(6,N,l+1+3*N)
-    # axall.imshow(data_flat,cmap=cmap,vmax=vmax,vmin=vmin)
-    # plt.setp(axall.get_xticklabels(), visible=False)
-    # plt.setp(axall.get_yticklabels(), visible=False)
-    # if l==0:
-    #     axall.set_ylabel('FLATTEN DATA')
-    # axall = figall.add_subplot(6,N,l+1+4*N)
-    # axall.imshow(model,cmap=cmap,vmax=vmax,vmin=vmin)
-    # plt.setp(axall.get_xticklabels(), visible=False)
-    # plt.setp(axall.get_yticklabels(), visible=False)
-    # if l==0:
-    #     axall.set_ylabel('MODEL')
-    # axall = figall.add_subplot(6,N,l+1+5*N)
-    # axall.imshow(res,cmap=cmap,vmax=vmax,vmin=vmin)
-    # plt.setp(axall.get_xticklabels(), visible=False)
-    # plt.setp(axall.get_yticklabels(), visible=False)
-    # if l==0:
-    #     axall.set_ylabel('RES')
-
-    cax = ax.imshow(model,cmap=cmap,vmax=vmax,vmin=vmin)
-    caxres = axres.imshow(res,cmap=cmap,vmax=vmax,vmin=vmin)
-
-    ax.set_title(idates[l],fontsize=6)
-    axres.set_title(idates[l],fontsize=6)
-
-    plt.setp(ax.get_xticklabels(), visible=False)
-    plt.setp(ax.get_yticklabels(), visible=False)
+if plot=='yes':
+    # plot displacements models and residuals
+    nfigure +=1
+    figres = plt.figure(nfigure,figsize=(14,10))
+    figres.subplots_adjust(hspace=.001,wspace=0.001)
+
+    nfigure +=1
+    fig = plt.figure(nfigure,figsize=(14,10))
+    fig.subplots_adjust(hspace=.001,wspace=0.01)
+
+    # nfigure +=1
+    # figall = plt.figure(nfigure,figsize=(20,9))
+    # figall.subplots_adjust(hspace=0.00001,wspace=0.001)
+
+    nfigure +=1
+    figclr = plt.figure(nfigure)
+    # plot color map
+    ax = figclr.add_subplot(1,1,1)
+    cax = ax.imshow(maps[:,:,-1],cmap=cmap,norm=tsnorm)
+    plt.setp( ax.get_xticklabels(), visible=False)
+    cbar = figclr.colorbar(cax, orientation='horizontal',aspect=5)
+    figclr.savefig('colorscale.eps', format='EPS',dpi=150)
 
-    plt.setp(axres.get_xticklabels(), visible=False)
-    plt.setp(axres.get_yticklabels(), visible=False)
+# reference removed from data and models: same for all dates
+offset = np.copy(basis[0].m)
+if Mker>0:
+    offset += kernels[0].m
 
-    # fig.tight_layout()
+if plot=='yes':
+    for l in range((N)):
+        data = maps[:,:,l]
+        data_flat = maps_flata[:,:,l] - offset
+        model = models[:,:,l] - offset
+        res = data_flat - model
+        ramp = maps_ramp[:,:,l]
+
+        ax = fig.add_subplot(4,int(N/4)+1,l+1)
+        axres = figres.add_subplot(4,int(N/4)+1,l+1)
+
+        # axall = figall.add_subplot(6,N,l+1)
+        # axall.imshow(data,cmap=cmap,vmax=vmax,vmin=vmin)
+        # axall.set_title(idates[l],fontsize=6)
+        # plt.setp(axall.get_xticklabels(), visible=False)
+        # plt.setp(axall.get_yticklabels(), visible=False)
+        # if l==0:
+        #     axall.set_ylabel('DATA')
+        # axall = figall.add_subplot(6,N,l+1+N)
+        # axall.imshow(ramp,cmap=cmap,vmax=vmax,vmin=vmin)
+        # plt.setp(axall.get_xticklabels(), visible=False)
+        # plt.setp(axall.get_yticklabels(), visible=False)
+        # if l==0:
+        #     axall.set_ylabel('RAMP')
+        # axall = figall.add_subplot(6,N,l+1+2*N)
+        # axall.imshow(tropo,cmap=cmap,vmax=vmax,vmin=vmin)
+        # plt.setp(axall.get_xticklabels(), visible=False)
+        # plt.setp(axall.get_yticklabels(), visible=False)
+        # if l==0:
+        #     axall.set_ylabel('TROP0')
+        # axall = figall.add_subplot(6,N,l+1+3*N)
+        # axall.imshow(data_flat,cmap=cmap,vmax=vmax,vmin=vmin)
+        # plt.setp(axall.get_xticklabels(), visible=False)
+        # plt.setp(axall.get_yticklabels(), visible=False)
+        # if l==0:
+        #     axall.set_ylabel('FLATTEN DATA')
+        # axall = figall.add_subplot(6,N,l+1+4*N)
+        # axall.imshow(model,cmap=cmap,vmax=vmax,vmin=vmin)
+        # plt.setp(axall.get_xticklabels(), visible=False)
+        # plt.setp(axall.get_yticklabels(), visible=False)
+        # if l==0:
+        #     axall.set_ylabel('MODEL')
+        # axall = figall.add_subplot(6,N,l+1+5*N)
+        # axall.imshow(res,cmap=cmap,vmax=vmax,vmin=vmin)
+        # plt.setp(axall.get_xticklabels(), visible=False)
+        # plt.setp(axall.get_yticklabels(), visible=False)
+        # if l==0:
+        #     axall.set_ylabel('RES')
+
+        cax = ax.imshow(model,cmap=cmap,norm=tsnorm,interpolation='nearest')
+        caxres = axres.imshow(res,cmap=cmap,norm=tsnorm,interpolation='nearest')
+
+        ax.set_title(idates[l],fontsize=6)
+        axres.set_title(idates[l],fontsize=6)
+
+        plt.setp(ax.get_xticklabels(), visible=False)
+        plt.setp(ax.get_yticklabels(), visible=False)
+
+        plt.setp(axres.get_xticklabels(), visible=False)
+        plt.setp(axres.get_yticklabels(), visible=False)
+
+def save_date(l):
+    # maps of date l, written by the pool workers forked with the cubes:
+    # files are independent from one date to the other
+    data_flat = maps_flata[:,:,l] - offset
+    model = models[:,:,l] - offset
+    res = data_flat - model
+    ramp = maps_ramp[:,:,l]
 
     # ############
     # # SAVE .R4 #
@@ -3747,68 +1987,51 @@ for l in range((N)):
 
         if arguments["--geotiff"] is not None:
 
-            ds = driver.Create(outdir+'{}_flat.tif'.format(idates[l]), new_cols, new_lines, 1, gdal.GDT_Float32)
-            band = ds.GetRasterBand(1)
-            band.WriteArray(data_flat)
-            ds.SetGeoTransform(gt)
-            ds.SetProjection(proj)
-            band.FlushCache()
-
-            ds = driver.Create(outdir+'{}_ramp_tropo.tif'.format(idates[l]), new_cols, new_lines, 1, gdal.GDT_Float32)
-            band = ds.GetRasterBand(1)
-            band.WriteArray(ramp+tropo)
-            ds.SetGeoTransform(gt)
-            ds.SetProjection(proj)
-            band.FlushCache()
-
-            ds = driver.Create(outdir+'{}_model.tif'.format(idates[l]), new_cols, new_lines, 1, gdal.GDT_Float32)
-            band = ds.GetRasterBand(1)
-            band.WriteArray(model)
+            # one raster per date, one band per map
+            ds = driver.Create(outdir+'{}.tif'.format(idates[l]), new_cols, new_lines, 4, gdal.GDT_Float32, options=tiff_options+['INTERLEAVE=BAND'])
             ds.SetGeoTransform(gt)
             ds.SetProjection(proj)
-            band.FlushCache()
-
-            # ds = driver.Create(outdir+'{}_res.tif'.format(idates[l]), new_cols, new_lines, 1, gdal.GDT_Float32)
-            # band = ds.GetRasterBand(1)
-            # band.WriteArray(res)
-            # ds.SetGeoTransform(gt)
-            # ds.SetProjection(proj)
-            # band.FlushCache()
+            for b, (name, data) in enumerate([('flat',data_flat),('ramp_tropo',ramp),('model',model),('res',res)]):
+                band = ds.GetRasterBand(b+1)
+                band.SetDescription(name)
+                band.WriteArray(data)
+            ds.FlushCache()
+            del ds
 
         else:
 
-            fid = open(outdir+'{}_flat.r4'.format(idates[l]), 'wb')
-            data_flat.flatten().astype('float32').tofile(fid)
-            fid.close()
+            data_flat.astype('float32',copy=False).tofile(outdir+'{}_flat.r4'.format(idates[l]))
 
             # save ramp maps
-            fid = open(outdir+'{}_ramp_tropo.r4'.format(idates[l]), 'wb')
-            (ramp+tropo).flatten().astype('float32').tofile(fid)
-            fid.close()
+            ramp.astype('float32',copy=False).tofile(outdir+'{}_ramp_tropo.r4'.format(idates[l]))
 
             # save model maps
-            fid = open(outdir+'{}_model.r4'.format(idates[l]), 'wb')
-            model.flatten().astype('float32').tofile(fid)
-            fid.close()
+            model.astype('float32',copy=False).tofile(outdir+'{}_model.r4'.format(idates[l]))
 
             # save residual maps
-            fid = open(outdir+'{}_res.r4'.format(idates[l]), 'wb')
-            res.flatten().astype('float32').tofile(fid)
-            # fid.close()
+            res.astype('float32',copy=False).tofile(outdir+'{}_res.r4'.format(idates[l]))
 
+if arguments["--fulloutput"]=='yes':
+    with TimeIt():
+        if nproc > 1:
+            with poolcontext(processes=nproc,initializer=init_worker) as pool:
+                pool.map(save_date, range(N))
+        else:
+            for l in range((N)):
+                save_date(l)
 
-fig.suptitle('Time series models')
-figres.suptitle('Time series residuals')
-# figall.suptitle('Time series inversion')
-fig.savefig('models.eps', format='EPS',dpi=150)
-figres.savefig('residuals.eps', format='EPS',dpi=150)
-# figall.savefig('timeseries.eps', format='EPS',dpi=150)
 if plot=='yes':
+    fig.suptitle('Time series models')
+    figres.suptitle('Time series residuals')
+    # figall.suptitle('Time series inversion')
+    fig.savefig('models.eps', format='EPS',dpi=150)
+    figres.savefig('residuals.eps', format='EPS',dpi=150)
+    # figall.savefig('timeseries.eps', format='EPS',dpi=150)
     plt.show()
 plt.close('all')
 
 # clean memory
-del maps_ramp, maps_flata, maps_topo
+del maps_ramp, maps_flata, offset
 
 #######################################################
 # Save functions in binary file
@@ -3818,7 +2041,7 @@ if arguments["--geotiff"] is not None:
     for l in range((Mbasis)):
         outname = '{}_coeff.tif'.format(basis[l].reduction)
         logger.info('Save: {}'.format(outname))
-        ds = driver.Create(outname, new_cols, new_lines, 1, gdal.GDT_Float32)
+        ds = driver.Create(outname, new_cols, new_lines, 1, gdal.GDT_Float32, options=tiff_options)
         band = ds.GetRasterBand(1)
         band.WriteArray(basis[l].m)
         ds.SetGeoTransform(gt)
@@ -3828,7 +2051,7 @@ if arguments["--geotiff"] is not None:
 
         outname = '{}_sigcoeff.tif'.format(basis[l].reduction)
         logger.info('Save: {}'.format(outname))
-        ds = driver.Create(outname, new_cols, new_lines, 1, gdal.GDT_Float32)
+        ds = driver.Create(outname, new_cols, new_lines, 1, gdal.GDT_Float32, options=tiff_options)
         band = ds.GetRasterBand(1)
         band.WriteArray(basis[l].sigmam)
         ds.SetGeoTransform(gt)
@@ -3839,7 +2062,7 @@ if arguments["--geotiff"] is not None:
     for l in range((Mker)):
         outname = '{}_coeff.tif'.format(kernels[l].reduction)
         logger.info('Save: {}'.format(outname))
-        ds = driver.Create(outname, new_cols, new_lines, 1, gdal.GDT_Float32)
+        ds = driver.Create(outname, new_cols, new_lines, 1, gdal.GDT_Float32, options=tiff_options)
         band = ds.GetRasterBand(1)
         band.WriteArray(kernels[l].m)
         ds.SetGeoTransform(gt)
@@ -3849,7 +2072,7 @@ if arguments["--geotiff"] is not None:
 
         outname = '{}_sigcoeff.tif'.format(kernels[l].reduction)
         logger.info('Save: {}'.format(outname))
-        ds = driver.Create(outname, new_cols, new_lines, 1, gdal.GDT_Float32)
+        ds = driver.Create(outname, new_cols, new_lines, 1, gdal.GDT_Float32, options=tiff_options)
         band = ds.GetRasterBand(1)
         band.WriteArray(kernels[l].sigmam)
         ds.SetGeoTransform(gt)
@@ -3861,45 +2084,38 @@ else:
     for l in range((Mbasis)):
         outname = '{}_coeff.r4'.format(basis[l].reduction)
         logger.info('Save: {}'.format(outname))
-        fid = open(outname, 'wb')
-        basis[l].m.flatten().astype('float32').tofile(fid)
-        fid.close()
+        basis[l].m.astype('float32',copy=False).tofile(outname)
         outname = '{}_sigcoeff.r4'.format(basis[l].reduction)
         logger.info('Save: {}'.format(outname))
-        fid = open(outname, 'wb')
-        basis[l].sigmam.flatten().astype('float32').tofile(fid)
-        fid.close()
+        basis[l].sigmam.astype('float32',copy=False).tofile(outname)
     for l in range((Mker)):
         outname = '{}_coeff.r4'.format(kernels[l].reduction)
         logger.info('Save: {}'.format(outname))
-        fid = open('{}_coeff.r4'.format(kernels[l].reduction), 'wb')
-        kernels[l].m.flatten().astype('float32').tofile(fid)
-        fid.close()
+        kernels[l].m.astype('float32',copy=False).tofile(outname)
         outname = '{}_sigcoeff.r4'.format(kernels[l].reduction)
         logger.info('Save: {}'.format(outname))
-        fid = open('{}_sigcoeff.r4'.format(kernels[l].reduction), 'wb')
-        kernels[l].sigmam.flatten().astype('float32').tofile(fid)
-        fid.close()
+        kernels[l].sigmam.astype('float32',copy=False).tofile(outname)
+
 
+def amp_phase(cosine,sine,sigcosine,sigsine):
+    '''Amplitude and phase maps of a cosine/sine pair, and their uncertainties'''
+    amp = np.hypot(cosine,sine)
+    phi = np.arctan2(sine,cosine)
+    sigamp = np.hypot(sigcosine,sigsine)
+    sigphi = (sigcosine*abs(sine)+sigsine*abs(cosine))/np.square(sigamp)
+    return amp, phi, sigamp, sigphi
 
 #######################################################
 # Compute Amplitude and phase seasonal
 #######################################################
 
 if arguments["--seasonal"]  == 'yes':
-    cosine = as_strided(basis[indexseas].m)
-    sine = as_strided(basis[indexseas+1].m)
-    amp = np.sqrt(cosine**2+sine**2)
-    phi = np.arctan2(sine,cosine)
-
-    sigcosine = as_strided(basis[indexseas].sigmam)
-    sigsine = as_strided(basis[indexseas+1].sigmam)
-    sigamp = np.sqrt(sigcosine**2+sigsine**2)
-    sigphi = (sigcosine*abs(sine)+sigsine*abs(cosine))/(sigcosine**2+sigsine**2)
+    amp, phi, sigamp, sigphi = amp_phase(basis[indexseas].m,basis[indexseas+1].m,\
+        basis[indexseas].sigmam,basis[indexseas+1].sigmam)
 
     if arguments["--geotiff"] is not None:
         logger.info('Save: {}'.format(outname))
-        ds = driver.Create('ampwt_coeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32)
+        ds = driver.Create('ampwt_coeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32, options=tiff_options)
         band = ds.GetRasterBand(1)
         band.WriteArray(amp)
         ds.SetGeoTransform(gt)
@@ -3908,7 +2124,7 @@ if arguments["--seasonal"]  == 'yes':
         del ds
 
         logger.info('Save: {}'.format('ampwt_sigcoeff.tif'))
-        ds = driver.Create('ampwt_sigcoeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32)
+        ds = driver.Create('ampwt_sigcoeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32, options=tiff_options)
         band = ds.GetRasterBand(1)
         band.WriteArray(sigamp)
         ds.SetGeoTransform(gt)
@@ -3918,18 +2134,14 @@ if arguments["--seasonal"]  == 'yes':
 
     else:
         logger.info('Save: {}'.format('ampwt_coeff.r4'))
-        fid = open('ampwt_coeff.r4', 'wb')
-        amp.flatten().astype('float32').tofile(fid)
-        fid.close()
+        amp.astype('float32',copy=False).tofile('ampwt_coeff.r4')
 
         logger.info('Save: {}'.format('ampwt_sigcoeff.r4'))
-        fid = open('ampwt_sigcoeff.r4', 'wb')
-        sigamp.flatten().astype('float32').tofile(fid)
-        fid.close()
+        sigamp.astype('float32',copy=False).tofile('ampwt_sigcoeff.r4')
 
     if arguments["--geotiff"] is not None:
         logger.info('Save: {}'.format('phiwt_coeff.tif'))
-        ds = driver.Create('phiwt_coeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32)
+        ds = driver.Create('phiwt_coeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32, options=tiff_options)
         band = ds.GetRasterBand(1)
         band.WriteArray(phi)
         ds.SetGeoTransform(gt)
@@ -3938,7 +2150,7 @@ if arguments["--seasonal"]  == 'yes':
         del ds
 
         logger.info('Save: {}'.format('phiwt_sigcoeff.tif'))
-        ds = driver.Create('phiwt_sigcoeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32)
+        ds = driver.Create('phiwt_sigcoeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32, options=tiff_options)
         band = ds.GetRasterBand(1)
         band.WriteArray(sigphi)
         ds.SetGeoTransform(gt)
@@ -3948,29 +2160,18 @@ if arguments["--seasonal"]  == 'yes':
 
     else:
         logger.info('Save: {}'.format('phiwt_coeff.r4'))
-        fid = open('phiwt_coeff.r4', 'wb')
-        phi.flatten().astype('float32').tofile(fid)
-        fid.close()
+        phi.astype('float32',copy=False).tofile('phiwt_coeff.r4')
 
         logger.info('Save: {}'.format('phiwt_sigcoeff.r4'))
-        fid = open('phiwt_sigcoeff.r4', 'wb')
-        sigphi.flatten().astype('float32').tofile(fid)
-        fid.close()
+        sigphi.astype('float32',copy=False).tofile('phiwt_sigcoeff.r4')
 
 if arguments["--semianual"] == 'yes':
-    cosine = as_strided(basis[indexsemi].m)
-    sine = as_strided(basis[indexsemi+1].m)
-    amp = np.sqrt(cosine**2+sine**2)
-    phi = np.arctan2(sine,cosine)
-
-    sigcosine = as_strided(basis[indexseas].sigmam)
-    sigsine = as_strided(basis[indexseas+1].sigmam)
-    sigamp = np.sqrt(sigcosine**2+sigsine**2)
-    sigphi = (sigcosine*abs(sine)+sigsine*abs(cosine))/(sigcosine**2+sigsine**2)
+    amp, phi, sigamp, sigphi = amp_phase(basis[indexsemi].m,basis[indexsemi+1].m,\
+        basis[indexsemi].sigmam,basis[indexsemi+1].sigmam)
 
     if arguments["--geotiff"] is not None:
         logger.info('Save: {}'.format('amp_simiwt_coeff.tif'))
-        ds = driver.Create('amp_simiwt_coeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32)
+        ds = driver.Create('amp_simiwt_coeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32, options=tiff_options)
         band = ds.GetRasterBand(1)
         band.WriteArray(amp)
         ds.SetGeoTransform(gt)
@@ -3979,7 +2180,7 @@ if arguments["--semianual"] == 'yes':
         del ds
 
         logger.info('Save: {}'.format('amp_simiwt_sigcoeff.tif'))
-        ds = driver.Create('amp_simiwt_sigcoeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32)
+        ds = driver.Create('amp_simiwt_sigcoeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32, options=tiff_options)
         band = ds.GetRasterBand(1)
         band.WriteArray(sigamp)
         ds.SetGeoTransform(gt)
@@ -3989,18 +2190,15 @@ if arguments["--semianual"] == 'yes':
 
     else:
         logger.info('Save: {}'.format('amp_simiwt_coeff.r4'))
-        fid = open('amp_simiwt_coeff.r4', 'wb')
-        amp.flatten().astype('float32').tofile(fid)
-        fid.close()
+        amp.astype('float32',copy=False).tofile('amp_simiwt_coeff.r4')
 
         logger.info('Save: {}'.format('amp_simiwt_sigcoeff.r4'))
-        fid = open('amp_simiwt_sigcoeff.r4', 'wb')
-        sigamp.flatten().astype('float32').tofile(fid)
-        fid.close()
+        sigamp.astype('float32',copy=False).tofile('amp_simiwt_sigcoeff.r4')
 
     if arguments["--geotiff"] is not None:
         logger.info('Save: {}'.format('phi_simiwt_coeff.tif'))
-        ds = driver.Create('phi_simiwt_coeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32)
+        ds = driver.Create('phi_simiwt_coeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32, options=tiff_options)
+        band = ds.GetRasterBand(1)
         band.WriteArray(phi)
         ds.SetGeoTransform(gt)
         ds.SetProjection(proj)
@@ -4008,7 +2206,8 @@ if arguments["--semianual"] == 'yes':
         del ds
 
         logger.info('Save: {}'.format('phi_simiwt_sigcoeff.tif'))
-        ds = driver.Create('phi_simiwt_sigcoeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32)
+        ds = driver.Create('phi_simiwt_sigcoeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32, options=tiff_options)
+        band = ds.GetRasterBand(1)
         band.WriteArray(sigphi)
         ds.SetGeoTransform(gt)
         ds.SetProjection(proj)
@@ -4017,29 +2216,18 @@ if arguments["--semianual"] == 'yes':
 
     else:
         logger.info('Save: {}'.format('phi_simiwt_coeff.r4'))
-        fid = open('phi_simiwt_coeff.r4', 'wb')
-        phi.flatten().astype('float32').tofile(fid)
-        fid.close()
+        phi.astype('float32',copy=False).tofile('phi_simiwt_coeff.r4')
 
         logger.info('Save: {}'.format('phi_simiwt_sigcoeff.r4'))
-        fid = open('phi_simiwt_sigcoeff.r4', 'wb')
-        sigphi.flatten().astype('float32').tofile(fid)
-        fid.close()
+        sigphi.astype('float32',copy=False).tofile('phi_simiwt_sigcoeff.r4')
 
 if arguments["--bianual"] == 'yes':
-    cosine = as_strided(basis[indexbi].m)
-    sine = as_strided(basis[indexbi+1].m)
-    amp = np.sqrt(cosine**2+sine**2)
-    phi = np.arctan2(sine,cosine)
-
-    sigcosine = as_strided(basis[indexbi].sigmam)
-    sigsine = as_strided(basis[indexbi+1].sigmam)
-    sigamp = np.sqrt(sigcosine**2+sigsine**2)
-    sigphi = (sigcosine*abs(sine)+sigsine*abs(cosine))/(sigcosine**2+sigsine**2)
+    amp, phi, sigamp, sigphi = amp_phase(basis[indexbi].m,basis[indexbi+1].m,\
+        basis[indexbi].sigmam,basis[indexbi+1].sigmam)
 
     if arguments["--geotiff"] is not None:
         logger.info('Save: {}'.format('amp_biwt_coeff.tif'))
-        ds = driver.Create('ampw.5t_coeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32)
+        ds = driver.Create('ampw.5t_coeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32, options=tiff_options)
         band = ds.GetRasterBand(1)
         band.WriteArray(amp)
         ds.SetGeoTransform(gt)
@@ -4048,7 +2236,7 @@ if arguments["--bianual"] == 'yes':
         del ds
 
         logger.info('Save: {}'.format('amp_biwt_sigcoeff.tif'))
-        ds = driver.Create('ampw.5t_sigcoeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32)
+        ds = driver.Create('ampw.5t_sigcoeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32, options=tiff_options)
         band = ds.GetRasterBand(1)
         band.WriteArray(sigamp)
         ds.SetGeoTransform(gt)
@@ -4058,18 +2246,15 @@ if arguments["--bianual"] == 'yes':
 
     else:
         logger.info('Save: {}'.format('amp_biwt_coeff.r4'))
-        fid = open('ampw.5t_coeff.r4', 'wb')
-        amp.flatten().astype('float32').tofile(fid)
-        fid.close()
+        amp.astype('float32',copy=False).tofile('ampw.5t_coeff.r4')
 
         logger.info('Save: {}'.format('amp_biwt_sigcoeff.r4'))
-        fid = open('ampw.5t_sigcoeff.r4', 'wb')
-        sigamp.flatten().astype('float32').tofile(fid)
-        fid.close()
+        sigamp.astype('float32',copy=False).tofile('ampw.5t_sigcoeff.r4')
 
     if arguments["--geotiff"] is not None:
         logger.info('Save: {}'.format('phi_biwt_coeff.tif'))
-        ds = driver.Create('phiw.5t_coeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32)
+        ds = driver.Create('phiw.5t_coeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32, options=tiff_options)
+        band = ds.GetRasterBand(1)
         band.WriteArray(phi)
         ds.SetGeoTransform(gt)
         ds.SetProjection(proj)
@@ -4077,7 +2262,8 @@ if arguments["--bianual"] == 'yes':
         del ds
 
         logger.info('Save: {}'.format('phi_biwt_sigcoeff.tif'))
-        ds = driver.Create('phiw.5t_sigcoeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32)
+        ds = driver.Create('phiw.5t_sigcoeff.tif', new_cols, new_lines, 1, gdal.GDT_Float32, options=tiff_options)
+        band = ds.GetRasterBand(1)
         band.WriteArray(sigphi)
         ds.SetGeoTransform(gt)
         ds.SetProjection(proj)
@@ -4086,72 +2272,70 @@ if arguments["--bianual"] == 'yes':
 
     else:
         logger.info('Save: {}'.format('phi_biwt_coeff.r4'))
-        fid = open('phiw.5t_coeff.r4', 'wb')
-        phi.flatten().astype('float32').tofile(fid)
-        fid.close()
+        phi.astype('float32',copy=False).tofile('phiw.5t_coeff.r4')
 
         logger.info('Save: {}'.format('phi_biwt_sigcoeff.r4'))
-        fid = open('phiw.5t_sigcoeff.r4', 'wb')
-        sigphi.flatten().astype('float32').tofile(fid)
-        fid.close()
+        sigphi.astype('float32',copy=False).tofile('phiw.5t_sigcoeff.r4')
 
 #######################################################
 # Plot
 #######################################################
 
-# plot ref term
-vmax = np.abs([np.nanpercentile(basis[0].m,98.),np.nanpercentile(basis[0].m,2.)]).max()
-vmin = -vmax
-
-nfigure +=1
-fig=plt.figure(nfigure,figsize=(14,12))
-
-ax = fig.add_subplot(1,M,1)
-cax = ax.imshow(basis[0].m,cmap=cmap,vmax=vmax,vmin=vmin)
-cbar = fig.colorbar(cax, orientation='vertical',shrink=0.2)
-plt.setp(ax.get_xticklabels(), visible=False)
-plt.setp(ax.get_yticklabels(), visible=False)
-
-# plot linear term
-vmax = np.abs([np.nanpercentile(basis[1].m,98.),np.nanpercentile(basis[1].m,2.)]).max()
-vmin = -vmax
-
-ax = fig.add_subplot(1,M,2)
-cax = ax.imshow(basis[1].m,cmap=cmap,vmax=vmax,vmin=vmin)
-ax.set_title(basis[1].reduction)
-cbar = fig.colorbar(cax, orientation='vertical',shrink=0.2)
-plt.setp(ax.get_xticklabels(), visible=False)
-plt.setp(ax.get_yticklabels(), visible=False)
-
-# plot others
-for l in range(2,Mbasis):
-    vmax = np.abs([np.nanpercentile(basis[l].m,98.),np.nanpercentile(basis[l].m,2.)]).max()
+if plot=='yes':
+    # color scales: 2-98 percentiles of all the coefficient maps at once
+    vmaxs = np.abs(np.nanpercentile(m_maps,[2.,98.],axis=(1,2))).max(axis=0)
+
+    # plot ref term
+    vmax = vmaxs[0]
     vmin = -vmax
 
-    ax = fig.add_subplot(1,M,l+1)
-    cax = ax.imshow(basis[l].m,cmap=cmap,vmax=vmax,vmin=vmin)
-    ax.set_title(basis[l].reduction)
-    # add colorbar
+    nfigure +=1
+    fig=plt.figure(nfigure,figsize=(14,12))
+
+    ax = fig.add_subplot(1,M,1)
+    cax = ax.imshow(basis[0].m,cmap=cmap,vmax=vmax,vmin=vmin)
     cbar = fig.colorbar(cax, orientation='vertical',shrink=0.2)
     plt.setp(ax.get_xticklabels(), visible=False)
     plt.setp(ax.get_yticklabels(), visible=False)
 
-for l in range(Mker):
-    vmax = np.abs([np.nanpercentile(kernels[l].m,98.),np.nanpercentile(kernels[l].m,2.)]).max()
+    # plot linear term
+    vmax = vmaxs[1]
     vmin = -vmax
 
-    ax = fig.add_subplot(1,M,Mbasis+l+1)
-    cax = ax.imshow(kernels[l].m,cmap=cmap,vmax=vmax,vmin=vmin)
-    ax.set_title(kernels[l].reduction)
+    ax = fig.add_subplot(1,M,2)
+    cax = ax.imshow(basis[1].m,cmap=cmap,vmax=vmax,vmin=vmin)
+    ax.set_title(basis[1].reduction)
+    cbar = fig.colorbar(cax, orientation='vertical',shrink=0.2)
     plt.setp(ax.get_xticklabels(), visible=False)
     plt.setp(ax.get_yticklabels(), visible=False)
-    cbar = fig.colorbar(cax, orientation='vertical',shrink=0.2)
-
-plt.suptitle('Time series decomposition')
 
-nfigure += 1
-fig.tight_layout()
-fig.savefig('inversion.eps', format='EPS',dpi=150)
-
-if plot=='yes':
+    # plot others
+    for l in range(2,Mbasis):
+        vmax = vmaxs[l]
+        vmin = -vmax
+
+        ax = fig.add_subplot(1,M,l+1)
+        cax = ax.imshow(basis[l].m,cmap=cmap,vmax=vmax,vmin=vmin)
+        ax.set_title(basis[l].reduction)
+        # add colorbar
+        cbar = fig.colorbar(cax, orientation='vertical',shrink=0.2)
+        plt.setp(ax.get_xticklabels(), visible=False)
+        plt.setp(ax.get_yticklabels(), visible=False)
+
+    for l in range(Mker):
+        vmax = vmaxs[Mbasis+l]
+        vmin = -vmax
+
+        ax = fig.add_subplot(1,M,Mbasis+l+1)
+        cax = ax.imshow(kernels[l].m,cmap=cmap,vmax=vmax,vmin=vmin)
+        ax.set_title(kernels[l].reduction)
+        plt.setp(ax.get_xticklabels(), visible=False)
+        plt.setp(ax.get_yticklabels(), visible=False)
+        cbar = fig.colorbar(cax, orientation='vertical',shrink=0.2)
+
+    plt.suptitle('Time series decomposition')
+
+    nfigure += 1
+    fig.tight_layout()
+    fig.savefig('inversion.eps', format='EPS',dpi=150)
     plt.show()
@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
 ################################################################################
@@ -36,7 +36,6 @@ from osgeo import gdal
 import numpy as np
 import docopt
 import gamma as gm
-import gdal
 gdal.UseExceptions()
 import shutil
 
@@ -73,7 +72,7 @@ else:
 if (arguments["--Bc"] == None):
    weight = None
 else:
-   bc = map(float,arguments["--Bc"].replace(',',' ').split())
+   bc = [float(x) for x in arguments["--Bc"].replace(',',' ').split()]
    btc, bpc = bc[0], bc[1]
 
 # A more predictable makedirs
@@ -101,17 +100,13 @@ date_1,date_2=np.loadtxt(int_list,comments="#",unpack=True,dtype='i,i')
 kmax=len(date_1)
 print("number of interferogram: ",kmax)
 # open baseline.rsc
-source2=file(baseline,'r')
-im,bp,bt,imd=np.loadtxt(source2,comments="#",usecols=(0,1,2,4),unpack=True,dtype='i,f,f,f')
+im,bp,bt,imd=np.loadtxt(baseline,comments="#",usecols=(0,1,2,4),unpack=True,dtype='i,f,f,f')
 print("image list=",baseline)
 nmax=len(imd)
 print("number of image: ",nmax)
 
-# Now, write list_pair
-wf = open(os.path.join(tsdir, "list_dates"), "w")
-for i in xrange((nmax)):
-    wf.write("%i %.6f %.6f %.6f\n" % (im[i], imd[i], bt[i], bp[i]))
-wf.close()
+# Now, write list_dates
+np.savetxt(os.path.join(tsdir, "list_dates"), np.column_stack((im,imd,bt,bp)), fmt="%i %.6f %.6f %.6f")
 
 # Create lndatadir variables
 lndatadir = os.path.join(tsdir, "LN_DATA/")
@@ -134,35 +129,29 @@ elif (arguments["--sigma"] != None) & (arguments["--Bc"] == None):
     do_sig = int(2) # user given weigth
     # print (sigma, weight)
     if len(sigma) != kmax:
-      w2 = []
-      for j in xrange((kmax)):
-        for i in xrange(len(sigma)):
-          if (bid[i]==date_1[j]) and  (bid2[i]==date_2[j]):
-              w2.append(weight[i])
-      if len(w2) != kmax:
+      # find the weight of each interferogram from its dates
+      w_pair = {(int(d1),int(d2)): w for d1,d2,w in zip(bid,bid2,weight)}
+      pairs = [(int(d1),int(d2)) for d1,d2 in zip(date_1,date_2)]
+      if any(pair not in w_pair for pair in pairs):
          print('Error: sigma file not the same size that the number of interferograms')
          sys.exit()
-      weigth = np.array(w2)
-    wf = open(os.path.join(tsdir, "list_pair"), "w")
-    for i in xrange((kmax)):
-        wf.write("%i %i %.6f\n" % (date_1[i], date_2[i], weight[i]))
-    wf.close()
+      weight = np.array([w_pair[pair] for pair in pairs])
+    np.savetxt(os.path.join(tsdir, "list_pair"), np.column_stack((date_1,date_2,weight)), fmt="%i %i %.6f")
 elif (arguments["--sigma"] == None) &  (arguments["--Bc"] != None):
      print('Weigth interferograms based on their baselines with Btc:{} and Bpc:{}'.format(btc,bpc))
      do_sig = int(0)
-     weight=np.zeros((kmax))
-     for i in xrange((kmax)):
-     	deltat = (abs(bt[im==date_1[i]] - bt[im==date_2[i]]))/btc
-     	deltap = (abs(bp[im==date_1[i]] - bt[im==date_2[i]]))/bpc
-        weight[i] = np.float(np.exp(-(deltap+deltat)))
-     wf = open(os.path.join(tsdir, "list_pair"), "w")
-     for i in xrange((kmax)):
-          wf.write("%i %i %.6f\n" % (date_1[i], date_2[i], weight[i]))
-     wf.close()
+     # index of the two images of each interferogram in baseline.rsc
+     index = {int(d): k for k,d in enumerate(im)}
+     i1 = np.array([index[int(d)] for d in date_1])
+     i2 = np.array([index[int(d)] for d in date_2])
+     deltat = abs(bt[i1] - bt[i2])/btc
+     deltap = abs(bp[i1] - bp[i2])/bpc
+     weight = np.exp(-(deltap+deltat))
+     np.savetxt(os.path.join(tsdir, "list_pair"), np.column_stack((date_1,date_2,weight)), fmt="%i %i %.6f")
 
 if sformat == 'ROI_PAC':
   iformat = int(0)
-  for kk in xrange((kmax)):
+  for kk in range((kmax)):
       date1, date2 = date_1[kk], date_2[kk]
       idate = str(date1) + '-' + str(date2)
       folder = int_path + 'int_'+ str(date1) + '_' + str(date2) + '/'
@@ -174,25 +163,34 @@ if sformat == 'ROI_PAC':
         print('Create link:',infile )
       else:
         print('Can not find:', infile)
-	
+
       try:  
-	os.symlink(infile,outint)
+        os.symlink(infile,outint)
         os.symlink(rscfile,outrsc)    
       except:
         pass
 
 else:
   iformat = int(1)
-  for kk in xrange((kmax)):
+  for kk in range((kmax)):
       date1, date2 = date_1[kk], date_2[kk]
       idate = str(date1) + '_' + str(date2)
+      outfile =  str(date1) + '-' + str(date2) + '.r4'
       if sformat == 'GTIFF':
         infile = os.path.abspath(int_path + '/' + prefix + str(date1) + '-' + str(date2) + suffix + '.tiff')
         ds = gdal.Open(infile, gdal.GA_ReadOnly)
         ds_band = ds.GetRasterBand(1)
-        los = ds_band.ReadAsArray(0, 0, ds.RasterXSize, ds.RasterYSize)
         lines,cols =  ds.RasterYSize, ds.RasterXSize
 
+        # save output: copy by strips of whole blocks, not the full image at once
+        print('Create  {} file, lines:{}, cols:{}'.format(outfile,lines, cols)) 
+        bh = ds_band.GetBlockSize()[1]
+        bh = bh*max(1,256//bh)
+        with open(lndatadir +outfile,'wb') as fid:
+          for i in range(0,lines,bh):
+            ds_band.ReadAsArray(0, i, cols, min(bh,lines-i)).astype('float32',copy=False).tofile(fid)
+        del ds
+
       elif sformat == 'GAMMA':
         infile = os.path.abspath(int_path + '/' + prefix + str(date1) + '_' + str(date2) + suffix + '.unw')
 
@@ -200,12 +198,9 @@ else:
         los = np.float32(los)
         lines,cols = gm.readpar()
 
-      # save output
-      outfile =  str(date1) + '-' + str(date2) + '.r4'
-      print('Create  {} file, lines:{}, cols:{}'.format(outfile,lines, cols)) 
-      fid = open(lndatadir +outfile,'wb')
-      los.flatten().astype('float32').tofile(fid)
-      fid.close()
+        # save output
+        print('Create  {} file, lines:{}, cols:{}'.format(outfile,lines, cols)) 
+        los.tofile(lndatadir +outfile)
       outrsc= lndatadir + str(date1)  + '-' + str(date2) + '.r4.rsc' 
       f = open(outrsc, "w")
       f.write("""\